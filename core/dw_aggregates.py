@@ -0,0 +1,148 @@
+# core/dw_aggregates.py
+from typing import Dict
+import pandas as pd
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, BigInteger,
+    select, insert, delete, func, inspect, text,
+)
+from .db_engine import engine
+from .dw_models import fact_opinion, dim_fecha
+
+# Tablas de agregados materializados (schema Fact).
+# Se guardan conteo y suma (no el promedio) para poder sumar lotes nuevos
+# sin recalcular: Promedio = SumaCalificacion / NumOpiniones.
+metadata = MetaData()
+
+agg_producto_mes = Table(
+    "OpinionProductoMes", metadata,
+    Column("IdProducto", Integer, primary_key=True, autoincrement=False),
+    Column("IdFuente", Integer, primary_key=True, autoincrement=False),
+    Column("Periodo", Integer, primary_key=True, autoincrement=False),  # YYYYMM
+    Column("NumOpiniones", BigInteger, nullable=False),
+    Column("SumaCalificacion", BigInteger, nullable=False),
+    schema="Fact",
+)
+
+agg_cliente_mes = Table(
+    "OpinionClienteMes", metadata,
+    Column("IdCliente", Integer, primary_key=True, autoincrement=False),
+    Column("Periodo", Integer, primary_key=True, autoincrement=False),  # YYYYMM
+    Column("NumOpiniones", BigInteger, nullable=False),
+    Column("SumaCalificacion", BigInteger, nullable=False),
+    schema="Fact",
+)
+
+# tabla -> columnas de agrupación
+ROLLUPS = {
+    "producto_mes": (agg_producto_mes, ["IdProducto", "IdFuente", "Periodo"]),
+    "cliente_mes": (agg_cliente_mes, ["IdCliente", "Periodo"]),
+}
+
+
+# Filas por MERGE: SQL Server admite hasta 1000 filas en un VALUES
+MERGE_ROWS = 1000
+
+
+def ensure_aggregate_tables() -> bool:
+    """
+    Crea las tablas de agregados en el DW si no existen. Si hubo que crear
+    alguna, se llenan desde Fact.Opinion (rebuild_aggregates) para que los
+    incrementos posteriores partan de los totales reales. Devuelve True en
+    ese caso.
+    """
+    insp = inspect(engine)
+    faltan = [t for t, _ in ROLLUPS.values() if not insp.has_table(t.name, schema=t.schema)]
+    if not faltan:
+        return False
+    metadata.create_all(engine, tables=faltan, checkfirst=True)
+    rebuild_aggregates()
+    return True
+
+
+def rollup_deltas(fact_dw: pd.DataFrame, sign: int = 1) -> Dict[str, pd.DataFrame]:
+    """
+    Calcula los incrementos de cada agregado a partir de un lote de hechos.
+    fact_dw debe traer IdProducto, IdCliente, IdFuente, Periodo y Calificacion.
+    sign=-1 da los decrementos (filas que se borran del DW).
+    """
+    deltas = {}
+    if fact_dw is None or fact_dw.empty:
+        return deltas
+
+    for name, (_, keys) in ROLLUPS.items():
+        g = (
+            fact_dw.groupby(keys, as_index=False)
+            .agg(
+                NumOpiniones=("Calificacion", "size"),
+                SumaCalificacion=("Calificacion", "sum"),
+            )
+        )
+        for c in keys + ["NumOpiniones", "SumaCalificacion"]:
+            g[c] = g[c].astype("int64")
+        g[["NumOpiniones", "SumaCalificacion"]] *= sign
+        deltas[name] = g
+    return deltas
+
+
+def _merge_sql(table, keys, values: str) -> str:
+    cols = keys + ["NumOpiniones", "SumaCalificacion"]
+    on = " AND ".join(f"t.{k} = s.{k}" for k in keys)
+    return (
+        f"MERGE {table.schema}.{table.name} WITH (HOLDLOCK) AS t "
+        f"USING (VALUES {values}) AS s ({', '.join(cols)}) ON {on} "
+        "WHEN MATCHED THEN UPDATE SET "
+        "NumOpiniones = t.NumOpiniones + s.NumOpiniones, "
+        "SumaCalificacion = t.SumaCalificacion + s.SumaCalificacion "
+        f"WHEN NOT MATCHED THEN INSERT ({', '.join(cols)}) "
+        f"VALUES ({', '.join('s.' + c for c in cols)});"
+    )
+
+
+def apply_deltas(conn, deltas: Dict[str, pd.DataFrame]) -> None:
+    """
+    Suma los incrementos a los agregados dentro de la transacción `conn`
+    (la misma que inserta los hechos, para que ambos queden consistentes).
+    Un MERGE por agregado (en tramos de MERGE_ROWS grupos), no una sentencia
+    por grupo. Los valores son enteros y van literales en el VALUES.
+    HOLDLOCK: con cargas concurrentes (micro-lote + main.py) dos MERGE sobre
+    la misma clave no pueden insertarla ambos.
+    """
+    for name, delta in deltas.items():
+        if delta.empty:
+            continue
+        table, keys = ROLLUPS[name]
+        data = delta[keys + ["NumOpiniones", "SumaCalificacion"]].astype("int64").values.tolist()
+        for i in range(0, len(data), MERGE_ROWS):
+            values = ", ".join(
+                "(" + ", ".join(str(int(v)) for v in row) + ")" for row in data[i:i + MERGE_ROWS]
+            )
+            conn.execute(text(_merge_sql(table, keys, values)))
+
+
+def rebuild_aggregates() -> None:
+    """
+    Recalcula los agregados desde cero a partir de Fact.Opinion.
+    Se llama sola al crear las tablas (ensure_aggregate_tables); después solo
+    hace falta tras una carga manual fuera del ETL (main.py --rebuild-aggregates).
+    """
+    periodo = dim_fecha.c.Anio * 100 + dim_fecha.c.Mes
+    joined = fact_opinion.join(dim_fecha, fact_opinion.c.IdFecha == dim_fecha.c.IdFecha)
+
+    with engine.begin() as conn:
+        for table, keys in ROLLUPS.values():
+            group_cols = [
+                periodo if k == "Periodo" else fact_opinion.c[k] for k in keys
+            ]
+            src = (
+                select(
+                    *group_cols,
+                    func.count().label("NumOpiniones"),
+                    func.sum(fact_opinion.c.Calificacion).label("SumaCalificacion"),
+                )
+                .select_from(joined)
+                .group_by(*group_cols)
+            )
+            conn.execute(delete(table))
+            conn.execute(
+                insert(table).from_select(keys + ["NumOpiniones", "SumaCalificacion"], src)
+            )
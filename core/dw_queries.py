@@ -0,0 +1,96 @@
+# core/dw_queries.py
+from typing import Iterator, Optional
+import pandas as pd
+from sqlalchemy import select
+from .db_engine import engine
+from .dw_models import (
+    fact_opinion,
+    dim_cliente,
+    dim_producto,
+    dim_fuente,
+    dim_fecha,
+)
+from .dw_aggregates import agg_producto_mes, agg_cliente_mes
+
+
+def _resumen(table, desde: Optional[int], hasta: Optional[int], **filtros) -> pd.DataFrame:
+    stmt = select(table)
+    if desde is not None:
+        stmt = stmt.where(table.c.Periodo >= desde)
+    if hasta is not None:
+        stmt = stmt.where(table.c.Periodo <= hasta)
+    for col, val in filtros.items():
+        if val is not None:
+            stmt = stmt.where(table.c[col] == val)
+
+    with engine.connect() as conn:
+        df = pd.read_sql(stmt, conn)
+
+    df["PromedioCalificacion"] = df["SumaCalificacion"] / df["NumOpiniones"].where(
+        df["NumOpiniones"] > 0
+    )
+    return df
+
+
+def resumen_producto_mes(
+    desde: Optional[int] = None,
+    hasta: Optional[int] = None,
+    id_producto: Optional[int] = None,
+    id_fuente: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Promedio de Calificacion y número de opiniones por producto/fuente/mes,
+    leído del agregado materializado (no toca Fact.Opinion).
+    desde/hasta son periodos YYYYMM inclusivos.
+    """
+    return _resumen(
+        agg_producto_mes, desde, hasta,
+        IdProducto=id_producto, IdFuente=id_fuente,
+    )
+
+
+def resumen_cliente_mes(
+    desde: Optional[int] = None,
+    hasta: Optional[int] = None,
+    id_cliente: Optional[int] = None,
+) -> pd.DataFrame:
+    """Promedio de Calificacion y número de opiniones por cliente/mes."""
+    return _resumen(agg_cliente_mes, desde, hasta, IdCliente=id_cliente)
+
+
+def iter_opiniones_detalle(chunk_size: int = 5000, desde=None, hasta=None) -> Iterator[pd.DataFrame]:
+    """
+    Detalle de Fact.Opinion con sus dimensiones, en bloques de `chunk_size`
+    filas (yield_per) en lugar de traer todo con fetchall().
+    desde/hasta filtran por Dimension.Fecha.Fecha (inclusive).
+    """
+    stmt = (
+        select(
+            fact_opinion.c.IdOpinion,
+            dim_cliente.c.Nombre.label("Cliente"),
+            dim_producto.c.Nombre.label("Producto"),
+            dim_fuente.c.Tipo.label("TipoFuente"),
+            dim_fecha.c.Fecha,
+            fact_opinion.c.Calificacion,
+            fact_opinion.c.Sentimiento,
+            fact_opinion.c.Satisfaccion,
+            fact_opinion.c.Comentario,
+        )
+        .select_from(
+            fact_opinion
+            .join(dim_cliente, fact_opinion.c.IdCliente == dim_cliente.c.IdCliente)
+            .join(dim_producto, fact_opinion.c.IdProducto == dim_producto.c.IdProducto)
+            .join(dim_fuente,  fact_opinion.c.IdFuente  == dim_fuente.c.IdFuente)
+            .join(dim_fecha,   fact_opinion.c.IdFecha   == dim_fecha.c.IdFecha)
+        )
+    )
+    if desde is not None:
+        stmt = stmt.where(dim_fecha.c.Fecha >= desde)
+    if hasta is not None:
+        stmt = stmt.where(dim_fecha.c.Fecha <= hasta)
+
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(stmt)
+        cols = list(result.keys())
+        for rows in result.partitions():
+            yield pd.DataFrame(rows, columns=cols)
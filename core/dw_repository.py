@@ -1,22 +1,112 @@
 # core/dw_repository.py
-from typing import List, Dict
-from sqlalchemy import insert
+from typing import Dict
+import pandas as pd
+from sqlalchemy import insert, delete, select
 from .db_engine import engine
-from .dw_models import fact_opinion  # tabla Fact.Opinion reflejada
+from .dw_models import fact_opinion, dim_fecha  # tablas reflejadas
+from .dw_aggregates import apply_deltas, rollup_deltas
 
 
-def insert_opiniones(rows: List[Dict]) -> None:
+def _fact_rows(batch: pd.DataFrame):
+    """Registros con solo las columnas de Fact.Opinion presentes en `batch`."""
+    return batch[[c for c in batch.columns if c in fact_opinion.c]].to_dict(orient="records")
+
+
+def insert_opiniones_batch(conn, batch: pd.DataFrame) -> int:
+    """
+    Inserta un lote de hechos con la conexión/transacción `conn` y suma sus
+    incrementos a los agregados. `batch` trae las columnas de Fact.Opinion
+    más Periodo (YYYYMM) y, opcionalmente, otras que no se insertan (claves
+    naturales de staging). Pensado para core.load_journal.run_batched_load.
+    """
+    if batch.empty:
+        return 0
+    rows = _fact_rows(batch)
+    conn.execute(insert(fact_opinion), rows)
+    apply_deltas(conn, rollup_deltas(batch))
+    return len(rows)
+
+
+def append_dimension(conn, df: pd.DataFrame, table: str) -> int:
+    """Agrega filas a Dimension.<table> con la conexión/transacción `conn`."""
+    df.to_sql(table, conn, schema="Dimension", if_exists="append", index=False)
+    return len(df)
+
+
+def ensure_fechas(conn, fecha_keys) -> Dict[int, int]:
     """
-    Inserta un lote de filas en Fact.Opinion (DWopiniones).
-    Cada dict debe tener las columnas:
-    IdCliente, IdProducto, IdFuente, IdFecha,
-    Calificacion, Sentimiento, Comentario, Satisfaccion.
+    Agrega a Dimension.Fecha las fechas (fecha_key YYYYMMDD) que aún no
+    existen, con la conexión/transacción `conn`, y devuelve
+    {fecha_key: IdFecha} de todas las pedidas.
     """
-    if not rows:
-        return
+    keys = sorted({int(k) for k in fecha_keys if int(k) > 0})
+    if not keys:
+        return {}
+    fechas = {k: pd.to_datetime(str(k), format="%Y%m%d").date() for k in keys}
+
+    def existentes():
+        found = {}
+        valores = list(fechas.values())
+        for i in range(0, len(valores), 1000):  # límite de parámetros de SQL Server
+            res = conn.execute(
+                select(dim_fecha.c.IdFecha, dim_fecha.c.Fecha)
+                .where(dim_fecha.c.Fecha.in_(valores[i:i + 1000]))
+            )
+            for r in res:
+                found[int(pd.Timestamp(r.Fecha).strftime("%Y%m%d"))] = int(r.IdFecha)
+        return found
 
-    stmt = insert(fact_opinion)
+    ids = existentes()
+    faltan = [fechas[k] for k in keys if k not in ids]
+    if faltan:
+        conn.execute(
+            insert(dim_fecha),
+            [{"Fecha": f, "Anio": f.year, "Mes": f.month, "Dia": f.day} for f in faltan],
+        )
+        ids = existentes()
+    return ids
+
+
+def replace_opiniones_rango(batch: pd.DataFrame, desde, hasta) -> pd.DataFrame:
+    """
+    Reemplaza en Fact.Opinion solo las filas cuyo IdFecha cae en [desde, hasta]
+    (según Dimension.Fecha): borra ese rango e inserta `batch` (mismo formato
+    que insert_opiniones_batch), en una sola transacción. Los agregados se
+    descuentan por lo borrado y se suman por lo insertado.
+    Devuelve, por Periodo, las filas borradas e insertadas.
+    """
+    ids_rango = select(dim_fecha.c.IdFecha).where(dim_fecha.c.Fecha.between(desde, hasta))
+    en_rango = fact_opinion.c.IdFecha.in_(ids_rango)
 
-    # Usamos transacción automática
     with engine.begin() as conn:
-        conn.execute(stmt, rows)
+        old = pd.read_sql(
+            select(
+                fact_opinion.c.IdProducto,
+                fact_opinion.c.IdCliente,
+                fact_opinion.c.IdFuente,
+                fact_opinion.c.Calificacion,
+                (dim_fecha.c.Anio * 100 + dim_fecha.c.Mes).label("Periodo"),
+            )
+            .select_from(fact_opinion.join(dim_fecha, fact_opinion.c.IdFecha == dim_fecha.c.IdFecha))
+            .where(en_rango),
+            conn,
+        )
+        apply_deltas(conn, rollup_deltas(old, sign=-1))
+        borradas = conn.execute(delete(fact_opinion).where(en_rango)).rowcount
+        if borradas >= 0 and borradas != len(old):
+            # se revierte todo: los agregados se descontaron por `old`
+            raise RuntimeError(f"Fact.Opinion: se borraron {borradas} filas de la ventana, se esperaban {len(old)}")
+
+        rows = _fact_rows(batch)
+        if rows:
+            conn.execute(insert(fact_opinion), rows)
+        apply_deltas(conn, rollup_deltas(batch))
+    return (
+        pd.DataFrame({
+            "borradas": old.groupby("Periodo").size(),
+            "insertadas": batch.groupby("Periodo").size(),
+        })
+        .fillna(0)
+        .astype("int64")
+        .sort_index()
+    )
@@ -0,0 +1,355 @@
+# core/load_journal.py
+import re
+import json
+import sqlite3
+import hashlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, insert
+from .db_engine import engine
+
+# Lotes confirmados del lado del DW. Se escribe en la MISMA transacción que
+# los datos, así un lote que llegó al DW pero no al journal local (caída entre
+# ambos commits) se detecta al reanudar y no se vuelve a cargar.
+metadata = MetaData()
+
+carga_lote = Table(
+    "EtlCargaLote", metadata,
+    Column("BatchId", String(80), primary_key=True),
+    Column("LoadId", String(40), nullable=False, index=True),
+    Column("Destino", String(64), nullable=False),
+    Column("Filas", Integer, nullable=False),
+    Column("FechaCarga", DateTime, nullable=False),
+)
+
+JOURNAL_DDL = """
+CREATE TABLE IF NOT EXISTS _load_journal (
+    batch_id TEXT PRIMARY KEY,
+    load_id TEXT NOT NULL,
+    destino TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    filas_staged INTEGER NOT NULL,
+    filas_loaded INTEGER,
+    estado TEXT NOT NULL,
+    fecha TEXT NOT NULL
+)
+"""
+
+# Plan de cada carga, guardado ANTES del primer lote: las filas planificadas
+# quedan en _load_pending_<destino> (con su lote) hasta que la carga termina,
+# así una corrida posterior completa exactamente esos lotes aunque las
+# fuentes hayan cambiado, y recién después planifica una carga nueva.
+# `marks` ({"table": ..., "values": {clave: valor}}) son marcas/offsets de
+# quien planificó la carga (p. ej. el modo micro-lote); se escriben en esa
+# tabla recién cuando el plan se completa, lo termine quien lo termine.
+PLAN_DDL = """
+CREATE TABLE IF NOT EXISTS _load_plan (
+    load_id TEXT PRIMARY KEY,
+    destino TEXT NOT NULL,
+    batches INTEGER NOT NULL,
+    filas INTEGER NOT NULL,
+    estado TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    marks TEXT
+)
+"""
+
+# Filas ya cargadas por destino (hash del contenido + nº de ocurrencia, para
+# no perder duplicados legítimos). Regla de deduplicación: una carga solo
+# lleva al DW las filas que no estén aquí, venga de main.py, del modo
+# micro-lote o de sync_dimensions_dw.py. El hash se toma sobre `key_cols`
+# (para hechos, las claves naturales de staging: no cambia si el DW reasigna
+# claves sustitutas). `particion` (p. ej. fecha_key) permite olvidar las
+# filas de una ventana reemplazada.
+ROWS_DDL = """
+CREATE TABLE IF NOT EXISTS _load_rows (
+    destino TEXT NOT NULL,
+    row_hash TEXT NOT NULL,
+    occ INTEGER NOT NULL,
+    particion INTEGER,
+    PRIMARY KEY (destino, row_hash, occ)
+)
+"""
+
+
+def ensure_journal(conn: sqlite3.Connection) -> None:
+    conn.execute(JOURNAL_DDL)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_load_journal_load ON _load_journal(load_id)")
+    conn.execute(PLAN_DDL)
+    if "marks" not in {r[1] for r in conn.execute("PRAGMA table_info(_load_plan)")}:
+        conn.execute("ALTER TABLE _load_plan ADD COLUMN marks TEXT")
+    conn.execute(ROWS_DDL)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_load_rows_particion ON _load_rows(destino, particion)")
+    conn.commit()
+    metadata.create_all(engine, checkfirst=True)
+
+
+def _pending_table(destino: str) -> str:
+    return "_load_pending_" + re.sub(r"[^A-Za-z0-9]+", "_", destino).lower()
+
+
+def _row_hashes(df: pd.DataFrame) -> pd.Series:
+    # sobre el texto de cada celda: no depende de int/float/object entre corridas
+    return pd.util.hash_pandas_object(df.astype(str), index=False).astype(str)
+
+
+def _loaded_counts(conn: sqlite3.Connection, destino: str, hashes) -> Dict[str, int]:
+    """Cuántas ocurrencias de cada hash ya se cargaron en `destino`."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _tmp_hashes (row_hash TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM _tmp_hashes")
+    conn.executemany("INSERT OR IGNORE INTO _tmp_hashes VALUES (?)", [(h,) for h in set(hashes)])
+    rows = conn.execute(
+        "SELECT r.row_hash, COUNT(*) FROM _load_rows r JOIN _tmp_hashes t ON t.row_hash = r.row_hash "
+        "WHERE r.destino = ? GROUP BY r.row_hash",
+        (destino,),
+    ).fetchall()
+    return dict(rows)
+
+
+def row_keys(conn: sqlite3.Connection, destino: str, df: pd.DataFrame,
+             incremental: bool = False, key_cols: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Agrega _row_hash/_occ a `df` y deja solo las filas que faltan en `destino`.
+    El hash se calcula sobre `key_cols` (por defecto, todas las columnas).
+    Sin `incremental`, `df` es el contenido completo (se saltean las primeras
+    ocurrencias ya cargadas de cada hash); con `incremental`, todas sus filas
+    son nuevas (micro-lote) y sus ocurrencias siguen a las ya cargadas.
+    """
+    out = df.copy()
+    out["_row_hash"] = _row_hashes(df[key_cols] if key_cols else df).values
+    out["_occ"] = out.groupby("_row_hash").cumcount()
+    ya = out["_row_hash"].map(_loaded_counts(conn, destino, out["_row_hash"])).fillna(0).astype("int64")
+    if incremental:
+        out["_occ"] += ya
+        return out
+    return out[out["_occ"] >= ya]
+
+
+def remember_rows(conn: sqlite3.Connection, destino: str, df: pd.DataFrame,
+                  partition_col: Optional[str] = None, key_cols: Optional[List[str]] = None) -> None:
+    """Registra `df` (ya con _row_hash/_occ, o sin ellas) como cargado en `destino`."""
+    if "_row_hash" not in df.columns:
+        df = row_keys(conn, destino, df, incremental=True, key_cols=key_cols)
+    part = df[partition_col] if partition_col else pd.Series([None] * len(df))
+    conn.executemany(
+        "INSERT OR IGNORE INTO _load_rows (destino, row_hash, occ, particion) VALUES (?, ?, ?, ?)",
+        [
+            (destino, h, int(o), None if p is None or pd.isna(p) else int(p))
+            for h, o, p in zip(df["_row_hash"], df["_occ"], part)
+        ],
+    )
+
+
+def forget_rows(conn: sqlite3.Connection, destino: str, desde: int, hasta: int) -> None:
+    """Olvida las filas cargadas con particion en [desde, hasta] (una ventana reemplazada)."""
+    conn.execute(
+        "DELETE FROM _load_rows WHERE destino = ? AND particion BETWEEN ? AND ?",
+        (destino, int(desde), int(hasta)),
+    )
+
+
+def _save_plan(conn: sqlite3.Connection, destino: str, df: pd.DataFrame, batch_size: int,
+               marks: Optional[Dict] = None) -> str:
+    """
+    Guarda las filas y los lotes de una carga nueva; devuelve su load_id,
+    determinista: destino + nº de plan del destino + contenido (hash/ocurrencia).
+    """
+    n_plan = conn.execute("SELECT COUNT(*) FROM _load_plan WHERE destino = ?", (destino,)).fetchone()[0]
+    h = hashlib.sha1(f"{destino}|{n_plan}".encode("utf-8"))
+    h.update("|".join(df["_row_hash"] + ":" + df["_occ"].astype(str)).encode("utf-8"))
+    load_id = h.hexdigest()
+
+    df = df.reset_index(drop=True)
+    df.insert(0, "_seq", df.index // batch_size)
+    df.to_sql(_pending_table(destino), conn, if_exists="replace", index=False)
+    conn.execute(
+        "INSERT INTO _load_plan (load_id, destino, batches, filas, estado, fecha, marks) "
+        "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+        (load_id, destino, int(df["_seq"].max()) + 1, len(df),
+         datetime.now().isoformat(timespec="seconds"), json.dumps(marks) if marks else None),
+    )
+    conn.commit()
+    return load_id
+
+
+def _pending_plan(conn: sqlite3.Connection, destino: str):
+    """(load_id, filas planificadas, marks) de la carga pendiente de `destino`, o None."""
+    row = conn.execute(
+        "SELECT load_id, marks FROM _load_plan WHERE destino = ? AND estado = 'pending'", (destino,)
+    ).fetchone()
+    if not row:
+        return None
+    data = pd.read_sql(f'SELECT * FROM "{_pending_table(destino)}" ORDER BY _seq', conn)
+    return row[0], data, json.loads(row[1]) if row[1] else None
+
+
+def has_pending_load(conn: sqlite3.Connection, destino: str) -> bool:
+    ensure_journal(conn)
+    return _pending_plan(conn, destino) is not None
+
+
+def _reconcile(conn: sqlite3.Connection, load_id: str, destino: str, plan,
+               partition_col: Optional[str] = None) -> None:
+    """Marca como confirmados los lotes que ya están en el DW pero no en el journal."""
+    with engine.connect() as dw:
+        en_dw = {
+            r.BatchId: r.Filas
+            for r in dw.execute(
+                select(carga_lote.c.BatchId, carga_lote.c.Filas).where(carga_lote.c.LoadId == load_id)
+            )
+        }
+    for seq, batch_id, part in plan:
+        if batch_id in en_dw:
+            _record(conn, batch_id, load_id, destino, seq, len(part), en_dw[batch_id], part, partition_col)
+
+
+def _record(conn, batch_id, load_id, destino, seq, staged, loaded, part, partition_col) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO _load_journal "
+        "(batch_id, load_id, destino, seq, filas_staged, filas_loaded, estado, fecha) "
+        "VALUES (?, ?, ?, ?, ?, ?, 'committed', ?)",
+        (batch_id, load_id, destino, seq, staged, loaded, datetime.now().isoformat(timespec="seconds")),
+    )
+    remember_rows(conn, destino, part, partition_col)
+    conn.commit()
+
+
+def committed_batches(conn: sqlite3.Connection, load_id: str) -> set:
+    rows = conn.execute(
+        "SELECT batch_id FROM _load_journal WHERE load_id = ? AND estado = 'committed'", (load_id,)
+    ).fetchall()
+    return {r[0] for r in rows}
+
+
+def verify_load(conn: sqlite3.Connection, load_id: str, expected_batches: int) -> Dict:
+    """Compara, por lote, filas en staging vs filas cargadas (journal local y DW)."""
+    local = pd.read_sql(
+        "SELECT batch_id, seq, filas_staged, filas_loaded FROM _load_journal WHERE load_id = ? ORDER BY seq",
+        conn, params=(load_id,),
+    )
+    with engine.connect() as dw:
+        remoto = pd.read_sql(
+            select(carga_lote.c.BatchId.label("batch_id"), carga_lote.c.Filas.label("filas_dw"))
+            .where(carga_lote.c.LoadId == load_id),
+            dw,
+        )
+    chk = local.merge(remoto, on="batch_id", how="left")
+    malos = chk[(chk["filas_staged"] != chk["filas_loaded"]) | (chk["filas_loaded"] != chk["filas_dw"])]
+    return {
+        "load_id": load_id,
+        "batches": expected_batches,
+        "committed": len(local),
+        "filas_staged": int(local["filas_staged"].sum()),
+        "filas_loaded": int(local["filas_loaded"].fillna(0).sum()),
+        "mismatches": malos["batch_id"].tolist(),
+        "ok": len(local) == expected_batches and malos.empty,
+    }
+
+
+def _write_marks(conn: sqlite3.Connection, marks: Optional[Dict]) -> None:
+    if marks:
+        conn.executemany(
+            f'INSERT OR REPLACE INTO "{marks["table"]}" (clave, valor) VALUES (?, ?)',
+            [(k, json.dumps(v)) for k, v in marks["values"].items()],
+        )
+
+
+def _execute_plan(conn: sqlite3.Connection, destino: str, load_id: str, data: pd.DataFrame,
+                  write_batch: Callable, log=None, partition_col: Optional[str] = None,
+                  marks: Optional[Dict] = None) -> Dict:
+    """Carga los lotes sin confirmar de un plan guardado y lo cierra si verifica."""
+    plan = [
+        (int(seq), f"{load_id[:16]}-{int(seq):05d}", part.drop(columns=["_seq"]))
+        for seq, part in data.groupby("_seq", sort=True)
+    ]
+    _reconcile(conn, load_id, destino, plan, partition_col)
+    done = committed_batches(conn, load_id)
+    if log and done:
+        log.info(f"{destino}: reanudando carga {load_id[:16]} en lote {len(done)}/{len(plan)}")
+
+    for seq, batch_id, part in plan:
+        if batch_id in done:
+            continue
+        with engine.begin() as dw:
+            loaded = write_batch(dw, part.drop(columns=["_row_hash", "_occ"]))
+            loaded = len(part) if loaded is None or loaded < 0 else int(loaded)
+            dw.execute(insert(carga_lote).values(
+                BatchId=batch_id, LoadId=load_id, Destino=destino,
+                Filas=loaded, FechaCarga=datetime.now(),
+            ))
+        _record(conn, batch_id, load_id, destino, seq, len(part), loaded, part, partition_col)
+        if log:
+            log.info(
+                f"{destino}: lote {seq + 1}/{len(plan)} confirmado ({loaded} filas)",
+                extra={"stage": "dw_load", "source": destino, "rows": loaded,
+                       "batch_id": batch_id, "rate_limit": 5},
+            )
+
+    result = verify_load(conn, load_id, len(plan))
+    if result["ok"]:
+        _write_marks(conn, marks)
+        conn.execute("UPDATE _load_plan SET estado = 'done' WHERE load_id = ?", (load_id,))
+        conn.execute(f'DROP TABLE IF EXISTS "{_pending_table(destino)}"')
+        conn.commit()
+    if log:
+        if result["ok"]:
+            log.info(f"{destino}: verificación OK, {result['filas_loaded']} filas en {result['batches']} lotes")
+        else:
+            log.warning(f"{destino}: verificación con diferencias: {result}")
+    return result
+
+
+def complete_pending(conn: sqlite3.Connection, destino: str, write_batch: Callable,
+                     log=None, partition_col: Optional[str] = None) -> Optional[Dict]:
+    """
+    Completa la carga pendiente de `destino` (si la hay), desde el primer lote
+    sin confirmar, y aplica sus marks. Devuelve el resultado o None.
+    """
+    ensure_journal(conn)
+    pendiente = _pending_plan(conn, destino)
+    if pendiente is None:
+        return None
+    load_id, data, marks = pendiente
+    if log:
+        log.info(f"{destino}: completando carga pendiente {load_id[:16]} ({len(data)} filas)")
+    return _execute_plan(conn, destino, load_id, data, write_batch, log, partition_col, marks)
+
+
+def run_batched_load(conn: sqlite3.Connection, destino: str, df: pd.DataFrame,
+                     write_batch: Callable, batch_size: int = 5000, log=None,
+                     incremental: bool = False, partition_col: Optional[str] = None,
+                     key_cols: Optional[List[str]] = None, marks: Optional[Dict] = None) -> Dict:
+    """
+    Carga `df` al DW en lotes independientes (una transacción por lote).
+    write_batch(conn_dw, lote) inserta el lote y devuelve las filas cargadas.
+
+    1. Si `destino` tiene una carga pendiente (plan guardado en _load_plan),
+       se completa primero, desde el primer lote sin confirmar.
+    2. Solo se planifican las filas de `df` que no están en _load_rows (ver
+       row_keys; `incremental` para micro-lotes que traen solo filas nuevas).
+    3. El plan se guarda en staging antes del primer lote y cada lote
+       confirmado queda en _load_journal y en EtlCargaLote (DW).
+    `partition_col` (columna de `df`) se guarda con cada fila cargada para
+    poder olvidarlas por partición (forget_rows); `key_cols` son las
+    columnas que identifican una fila (ver row_keys). `marks` se guardan con
+    el plan y se escriben al completarlo (ver PLAN_DDL).
+    """
+    result = complete_pending(conn, destino, write_batch, log, partition_col)
+    if result is not None and not result["ok"]:
+        return result
+
+    nuevas = row_keys(conn, destino, df, incremental=incremental, key_cols=key_cols)
+    if nuevas.empty:
+        if log:
+            log.info(f"{destino}: sin filas nuevas ({len(df)} ya cargadas), nada que hacer.")
+        _write_marks(conn, marks)
+        conn.commit()
+        return {"load_id": None, "batches": 0, "committed": 0, "filas_staged": 0,
+                "filas_loaded": 0, "mismatches": [], "ok": True}
+    if log and len(nuevas) < len(df):
+        log.info(f"{destino}: {len(df) - len(nuevas)} filas ya cargadas se omiten")
+
+    load_id = _save_plan(conn, destino, nuevas, batch_size, marks)
+    return _execute_plan(conn, destino, load_id, _pending_plan(conn, destino)[1],
+                         write_batch, log, partition_col, marks)
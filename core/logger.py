@@ -1,16 +1,215 @@
+import os
+import json
+import time
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def get_logger(name: str, log_file: str):
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+TEXT_FMT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# Campos estructurados que se aceptan vía extra={...}
+STRUCT_FIELDS = ("stage", "source", "rows", "run_id", "batch_id", "elapsed_ms")
+
+# Un listener (hilo) por archivo de log, compartido por todos los loggers
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos stage/source/rows si vienen."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for f in STRUCT_FIELDS + ("suppressed",):
+            v = getattr(record, f, None)
+            if v is not None:
+                doc[f] = v
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita mensajes de alta frecuencia. Se activa por mensaje con extra:
+      - rate_limit=<seg>: como máximo un registro cada <seg> por clave
+      - sample=<n>: se deja pasar 1 de cada n
+    La clave es extra["log_key"] o, por defecto, el punto de llamada
+    (archivo:línea). El siguiente registro emitido lleva `suppressed`
+    con cuántos se descartaron.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        interval = getattr(record, "rate_limit", None)
+        sample = getattr(record, "sample", None)
+        if interval is None and sample is None:
+            return True
+
+        key = getattr(record, "log_key", None) or f"{record.pathname}:{record.lineno}"
+        now = time.monotonic()
+        with self._lock:
+            last, seen, dropped = self._state.get(key, (None, 0, 0))
+            seen += 1
+            keep = True
+            if interval is not None and last is not None and now - last < interval:
+                keep = False
+            if sample is not None and sample > 1 and (seen - 1) % sample != 0:
+                keep = False
+
+            if keep:
+                if dropped:
+                    record.suppressed = dropped
+                self._state[key] = (now, seen, 0)
+            else:
+                self._state[key] = (last, seen, dropped + 1)
+        return keep
+
+
+class LockedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler seguro entre procesos: cada escritura toma un lock
+    de SO sobre <log>.lock, y si otro proceso ya rotó el archivo se reabre
+    antes de escribir. En Windows un archivo abierto por otro proceso no se
+    puede renombrar al rotar, así que allí el archivo se abre y se cierra
+    dentro del lock en cada escritura.
+    """
+
+    close_after_emit = os.name == "nt"
+
+    def __init__(self, filename, *args, **kwargs):
+        if self.close_after_emit:
+            kwargs["delay"] = True
+        super().__init__(filename, *args, **kwargs)
+        self._lock_file = open(self.baseFilename + ".lock", "a+b")
+
+    def _os_lock(self):
+        if os.name == "nt":
+            self._lock_file.seek(0)
+            msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+
+    def _os_unlock(self):
+        if os.name == "nt":
+            self._lock_file.seek(0)
+            msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            disk = os.stat(self.baseFilename)
+            mine = os.fstat(self.stream.fileno())
+            rotated = (disk.st_ino, disk.st_dev) != (mine.st_ino, mine.st_dev)
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record):
+        try:
+            self._os_lock()
+            locked = True
+        except OSError:
+            locked = False
+        try:
+            if locked:
+                self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            if self.close_after_emit and self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            if locked:
+                self._os_unlock()
+
+    def close(self):
+        super().close()
+        if not self._lock_file.closed:
+            self._lock_file.close()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que loguea: el registro se
+    encola tal cual y el formateo ocurre en el hilo del QueueListener.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _build_handlers(log_file: str, json_format: bool):
+    fmt = JsonFormatter() if json_format else logging.Formatter(TEXT_FMT)
+    handler = LockedRotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=3, encoding="utf-8")
+    handler.setFormatter(fmt)
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(TEXT_FMT))
+    return [handler, stream]
+
+
+def _queue_for(log_file: str, json_format: bool) -> queue.Queue:
+    key = os.path.abspath(log_file)
+    with _listeners_lock:
+        if key not in _listeners:
+            q = queue.Queue(-1)
+            listener = QueueListener(q, *_build_handlers(log_file, json_format), respect_handler_level=True)
+            listener.start()
+            _listeners[key] = (q, listener)
+        return _listeners[key][0]
+
+
+def shutdown_logging() -> None:
+    """Vacía las colas y detiene los listeners (se llama también en atexit)."""
+    with _listeners_lock:
+        for q, listener in _listeners.values():
+            listener.stop()
+            for h in listener.handlers:
+                h.close()
+        _listeners.clear()
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name: str, log_file: str, use_queue: bool = False, json_format: bool = False):
+    """
+    use_queue=True: los registros pasan por un QueueHandler y un único
+    QueueListener por archivo hace el formateo y la escritura a disco.
+    json_format=True: el archivo recibe una línea JSON por registro.
+    """
     logger = logging.getLogger(name)
     if logger.handlers:
         return logger
     logger.setLevel(logging.INFO)
-    handler = RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=3, encoding="utf-8")
-    fmt = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
-    handler.setFormatter(fmt)
-    logger.addHandler(handler)
-    stream = logging.StreamHandler()
-    stream.setFormatter(fmt)
-    logger.addHandler(stream)
-    return logger
\ No newline at end of file
+    # El filtro corre en el hilo que loguea, antes de encolar/formatear
+    logger.addFilter(RateLimitFilter())
+
+    if use_queue:
+        logger.addHandler(_DeferredQueueHandler(_queue_for(log_file, json_format)))
+        return logger
+
+    for h in _build_handlers(log_file, json_format):
+        logger.addHandler(h)
+    return logger
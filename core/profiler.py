@@ -0,0 +1,165 @@
+# core/profiler.py
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+
+
+def new_run_id() -> str:
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def _func_label(func) -> str:
+    filename, lineno, name = func
+    if filename == "~":
+        return name  # built-ins: "<built-in method ...>"
+    return f"{os.path.basename(filename)}:{name}:{lineno}"
+
+
+def collapsed_stacks(stats: pstats.Stats, max_paths: int = 200, max_depth: int = 64):
+    """
+    Convierte un perfil de cProfile a "stacks colapsados" (formato de
+    flamegraph.pl / speedscope): "raiz;...;funcion <microsegundos>".
+    cProfile solo guarda llamador -> llamado, así que el tiempo propio de
+    cada función se reparte entre sus caminos según el tiempo acumulado
+    aportado por cada llamador.
+    """
+    raw = stats.stats  # func -> (cc, nc, tt, ct, callers)
+    memo = {}
+
+    def paths_to(func, on_path):
+        if func in memo:
+            return memo[func]
+        callers = raw[func][4]
+        if not callers or len(on_path) >= max_depth:
+            res = [((func,), 1.0)]
+        else:
+            total = sum(c[3] for c in callers.values()) or 1.0
+            res = []
+            for caller, c in callers.items():
+                if caller in on_path or caller not in raw:
+                    continue
+                share = (c[3] or 0.0) / total
+                for path, frac in paths_to(caller, on_path | {func}):
+                    res.append((path + (func,), frac * share))
+            if not res:
+                res = [((func,), 1.0)]
+            res = sorted(res, key=lambda r: -r[1])[:max_paths]
+        memo[func] = res
+        return res
+
+    out = {}
+    for func, (_, _, tt, _, _) in raw.items():
+        if tt <= 0:
+            continue
+        for path, frac in paths_to(func, frozenset()):
+            us = int(tt * frac * 1_000_000)
+            if us > 0:
+                key = ";".join(_func_label(f) for f in path)
+                out[key] = out.get(key, 0) + us
+    return [f"{k} {v}" for k, v in sorted(out.items())]
+
+
+class StageProfiler:
+    """
+    Perfilado por etapa (cProfile + tracemalloc). Con enabled=False las
+    etapas solo miden tiempo, sin costo extra.
+
+        with prof.stage("build_fact") as st:
+            ...
+            st["rows"] = n   # filas procesadas, queda en summary.json
+
+    Escribe en <out_dir>/<run_id>/: <nn>_<etapa>.pstats, .alloc.txt
+    (top-N sitios de asignación) y .collapsed (flamegraph).
+    """
+
+    def __init__(self, out_dir: str, run_id: str = None, enabled: bool = False,
+                 top_n: int = 25, prefix: str = "", logger=None):
+        self.enabled = enabled
+        self.top_n = top_n
+        self.prefix = prefix
+        self.log = logger
+        self.run_id = run_id or new_run_id()
+        self.dir = os.path.join(out_dir, self.run_id)
+        self.stages = []
+        if enabled:
+            os.makedirs(self.dir, exist_ok=True)
+
+    def _base(self, name: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        return os.path.join(self.dir, f"{self.prefix}{len(self.stages):02d}_{safe}")
+
+    @contextmanager
+    def stage(self, name: str):
+        info = {"stage": name, "rows": None}
+        t0 = time.perf_counter()
+        if not self.enabled:
+            try:
+                yield info
+            finally:
+                info["elapsed_s"] = round(time.perf_counter() - t0, 4)
+                self.stages.append(info)
+            return
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        snap0 = tracemalloc.take_snapshot()
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield info
+        finally:
+            prof.disable()
+            elapsed = time.perf_counter() - t0
+            snap1 = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            self._write(name, info, prof, snap0, snap1, elapsed, peak)
+
+    def _write(self, name, info, prof, snap0, snap1, elapsed, peak):
+        base = self._base(name)
+
+        prof.dump_stats(base + ".pstats")
+        stats = pstats.Stats(prof)
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write("\n".join(collapsed_stacks(stats)) + "\n")
+
+        diff = snap1.compare_to(snap0, "lineno")
+        with open(base + ".alloc.txt", "w", encoding="utf-8") as f:
+            f.write(f"# {name}: top {self.top_n} sitios de asignación (neto en la etapa)\n")
+            for st in diff[: self.top_n]:
+                f.write(f"{st}\n")
+
+        info.update({
+            "elapsed_s": round(elapsed, 4),
+            "peak_mb": round(peak / (1024 * 1024), 2),
+            "net_alloc_mb": round(sum(s.size_diff for s in diff) / (1024 * 1024), 2),
+            "pstats": os.path.basename(base + ".pstats"),
+        })
+        if info.get("rows"):
+            info["rows_per_s"] = round(info["rows"] / elapsed, 1) if elapsed else None
+        self.stages.append(info)
+
+        if self.log:
+            self.log.info(
+                f"Profile {name}: {info['elapsed_s']}s, pico {info['peak_mb']} MB, filas {info['rows']}",
+                extra={"stage": name, "rows": info["rows"], "run_id": self.run_id,
+                       "elapsed_ms": int(elapsed * 1000)},
+            )
+
+    def write_summary(self) -> None:
+        if not self.enabled:
+            return
+        path = os.path.join(self.dir, f"{self.prefix}summary.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"run_id": self.run_id, "stages": self.stages}, f, indent=2, ensure_ascii=False)
+        if self.log:
+            self.log.info(f"Profile: resultados en {self.dir}")
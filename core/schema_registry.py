@@ -0,0 +1,51 @@
+# core/schema_registry.py
+from typing import Optional, Dict
+import pandas as pd
+
+
+def get_schema(cfg: dict, source: str) -> Optional[dict]:
+    """Esquema declarado en settings.json["schemas"] para una fuente (o None)."""
+    return cfg.get("schemas", {}).get(source)
+
+
+def fact_sources(cfg: dict) -> Dict[str, dict]:
+    """Fuentes que alimentan fact_opiniones (las que declaran 'fact')."""
+    return {k: s for k, s in cfg.get("schemas", {}).items() if s.get("fact")}
+
+
+def staging_table(source: str) -> str:
+    return f"stg_{source.replace('_csv', '')}"
+
+
+def csv_read_kwargs(schema: Optional[dict]) -> dict:
+    """
+    Opciones de read_csv a partir del esquema: tipos explícitos (sin
+    inferencia) y solo las columnas declaradas.
+    """
+    if not schema or not schema.get("columns"):
+        return {}
+    cols = schema["columns"]
+    return {"usecols": list(cols), "dtype": dict(cols)}
+
+
+def apply_renames(df: pd.DataFrame, schema: Optional[dict]) -> pd.DataFrame:
+    """Aplica 'rename' (sobre nombres ya estandarizados) sin pisar columnas existentes."""
+    if not schema or not schema.get("rename"):
+        return df
+    ren = {s: d for s, d in schema["rename"].items() if s in df.columns and d not in df.columns}
+    return df.rename(columns=ren) if ren else df
+
+
+def date_format(schema: Optional[dict], col: str) -> Optional[str]:
+    if not schema:
+        return None
+    return schema.get("dates", {}).get(col)
+
+
+def map_to_fact(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """Columnas canónicas de hechos según el mapeo 'fact' (canónica -> columna fuente)."""
+    out = pd.DataFrame(index=df.index)
+    for canon, src in schema.get("fact", {}).items():
+        if src in df.columns:
+            out[canon] = df[src]
+    return out
@@ -0,0 +1,137 @@
+# extract/cache.py
+import os
+import json
+import time
+import hashlib
+from typing import Optional
+import pandas as pd
+
+# Se incrementa si cambia la forma en que se estandarizan los DataFrames
+CACHE_FORMAT = 2
+
+
+def parquet_engine() -> Optional[str]:
+    """Motor Parquet disponible para pandas ("pyarrow"/"fastparquet") o None."""
+    for name in ("pyarrow", "fastparquet"):
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            continue
+    return None
+
+
+def _sha256_file(path: str, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExtractCache:
+    """
+    Caché de DataFrames ya extraídos y estandarizados, en Parquet.
+    La clave combina ruta + tamaño + mtime + hash del contenido + versión
+    del esquema; si el archivo no cambió, se devuelve el Parquet guardado.
+    Al superar `max_bytes` se eliminan las entradas menos usadas (LRU).
+    """
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "index.json")
+        self.index = self._load_index()
+
+    # ---------- índice ----------
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"entries": {}, "hashes": {}}
+
+    def _save_index(self) -> None:
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    # ---------- claves ----------
+    def fingerprint(self, path: str, schema: Optional[dict] = None) -> str:
+        st = os.stat(path)
+        apath = os.path.abspath(path)
+
+        # El hash del contenido solo se recalcula si cambió tamaño o mtime
+        known = self.index["hashes"].get(apath)
+        if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+            content = known["sha256"]
+        else:
+            content = _sha256_file(path)
+            self.index["hashes"][apath] = {
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": content,
+            }
+
+        schema_sig = json.dumps(schema or {}, sort_keys=True, ensure_ascii=False)
+        raw = "|".join([
+            apath, str(st.st_size), str(st.st_mtime_ns), content,
+            str((schema or {}).get("version", 0)),
+            hashlib.sha256(schema_sig.encode("utf-8")).hexdigest(),
+            str(CACHE_FORMAT),
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ---------- lectura / escritura ----------
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        entry = self.index["entries"].get(key)
+        if not entry:
+            return None
+        try:
+            df = pd.read_parquet(os.path.join(self.root, entry["file"]))
+        except Exception:
+            self._drop(key)
+            self._save_index()
+            return None
+        entry["last_used"] = time.time()
+        self._save_index()
+        return df
+
+    def put(self, key: str, df: pd.DataFrame, source: str = "") -> None:
+        fname = f"{key}.parquet"
+        fpath = os.path.join(self.root, fname)
+        df.to_parquet(fpath, index=False)
+        size = os.path.getsize(fpath)
+        if size > self.max_bytes:
+            os.remove(fpath)
+            return
+
+        # Una sola entrada vigente por fuente
+        for k, e in list(self.index["entries"].items()):
+            if source and e.get("source") == source and k != key:
+                self._drop(k)
+
+        self.index["entries"][key] = {
+            "file": fname, "bytes": size, "source": source, "last_used": time.time(),
+        }
+        self._evict(keep=key)
+        self._save_index()
+
+    def _drop(self, key: str) -> None:
+        entry = self.index["entries"].pop(key, None)
+        if entry:
+            try:
+                os.remove(os.path.join(self.root, entry["file"]))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep: str) -> None:
+        entries = self.index["entries"]
+        total = sum(e["bytes"] for e in entries.values())
+        for k, _ in sorted(entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if k == keep:
+                continue
+            total -= entries[k]["bytes"]
+            self._drop(k)
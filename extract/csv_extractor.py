@@ -1,10 +1,27 @@
 import pandas as pd
 from .base_extractor import IExtractor
+from core.schema_registry import csv_read_kwargs
 
 class CsvExtractor(IExtractor):
-    def __init__(self, path: str, **read_csv_kwargs):
+    def __init__(self, path: str, schema: dict = None, **read_csv_kwargs):
         self.path = path
-        self.kw = {"encoding":"utf-8","na_filter":False} | read_csv_kwargs
+        self.kw = {"encoding":"utf-8","na_filter":False}
+        if schema:
+            # Tipos y columnas declarados: sin inferencia, parser de pyarrow
+            self.kw |= csv_read_kwargs(schema) | {"engine": "pyarrow"}
+        self.kw |= read_csv_kwargs
 
     def extract(self) -> pd.DataFrame:
-        return pd.read_csv(self.path, **self.kw)
\ No newline at end of file
+        try:
+            df = pd.read_csv(self.path, **self.kw)
+        except (ImportError, ValueError):
+            # pyarrow no instalado u opción no soportada por ese engine
+            if self.kw.get("engine") != "pyarrow":
+                raise
+            kw = {k: v for k, v in self.kw.items() if k != "engine"}
+            return pd.read_csv(self.path, **kw)
+        if self.kw.get("engine") == "pyarrow":
+            # pyarrow ignora na_filter=False: celdas vacías -> "" como el parser por defecto
+            cols = [c for c, t in self.kw.get("dtype", {}).items() if t == "string" and c in df.columns]
+            df[cols] = df[cols].fillna("")
+        return df
@@ -1,14 +1,19 @@
 # extract/db_extractor.py
 import pandas as pd
+from sqlalchemy import text
 from .base_extractor import IExtractor
 from core.db_engine import get_engine
 
 class DatabaseExtractor(IExtractor):
-    def __init__(self, query: str):
+    def __init__(self, query: str, params: dict = None):
         self.query = query
+        self.params = params
         self.engine = get_engine()
 
     def extract(self) -> pd.DataFrame:
         with self.engine.connect() as conn:
-            df = pd.read_sql(self.query, conn)
+            if self.params:
+                df = pd.read_sql(text(self.query), conn, params=self.params)
+            else:
+                df = pd.read_sql(self.query, conn)
         return df
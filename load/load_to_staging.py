@@ -1,16 +1,131 @@
 import pandas as pd
 import sqlite3
 
+# Índices declarados por tabla: (nombre, columnas).
+# Se crean después de cada carga masiva (+ ANALYZE); to_sql con replace ya
+# borra la tabla junto con sus índices, así que la carga va sin índices.
+INDEXES = {
+    "dim_cliente": [
+        ("ix_dim_cliente_id", ["cliente_id"]),
+    ],
+    "dim_producto": [
+        ("ix_dim_producto_id", ["producto_id"]),
+    ],
+    "dim_fuente": [
+        ("ix_dim_fuente_id", ["fuente_id"]),
+        # lookup fuente (nombre) -> fuente_id sin tocar la tabla
+        ("ix_dim_fuente_nombre_id", ["nombre", "fuente_id"]),
+    ],
+    "dim_fecha": [
+        ("ix_dim_fecha_key", ["fecha_key"]),
+    ],
+    "fact_opiniones": [
+        # rangos por fecha_key cubriendo las claves de dimensión
+        ("ix_fact_fecha_key", ["fecha_key", "cliente_id", "producto_id", "fuente_id"]),
+        # partición mensual (YYYYMM) para reprocesar ventanas de fechas
+        ("ix_fact_periodo", ["periodo"]),
+    ],
+    # lecturas de fecha para construir dim_fecha (index-only scan)
+    "stg_social_comments": [("ix_stg_social_comments_fecha", ["fecha"])],
+    "stg_surveys": [("ix_stg_surveys_fecha", ["fecha"])],
+    "stg_web_reviews": [("ix_stg_web_reviews_fecha", ["fecha"])],
+    "stg_db_opiniones": [("ix_stg_db_opiniones_fecha", ["fecha"])],
+    "stg_api_opiniones": [("ix_stg_api_opiniones_fecha", ["fecha"])],
+}
+
+
+def _table_columns(conn: sqlite3.Connection, table: str):
+    return {r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def create_indexes(conn: sqlite3.Connection, table: str, analyze: bool = True):
+    cols_in_table = _table_columns(conn, table)
+    if not cols_in_table:
+        return
+    for name, cols in INDEXES.get(table, []):
+        # solo si la tabla trae todas las columnas del índice
+        if not set(cols) <= cols_in_table:
+            continue
+        col_list = ", ".join(f'"{c}"' for c in cols)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}"({col_list})')
+    if analyze:
+        conn.execute(f'ANALYZE "{table}"')
+
+
 def upsert_table(df: pd.DataFrame, conn: sqlite3.Connection, table: str):
     df.to_sql(table, conn, if_exists="replace", index=False)
+    create_indexes(conn, table)
+    conn.commit()
+
+
+def partition_where(col: str, n: int) -> str:
+    """Filtro por particiones `col IN (?, ...)` con n parámetros."""
+    return f'"{col}" IN ({", ".join("?" * n)})'
+
+
+def replace_partitions(df: pd.DataFrame, conn: sqlite3.Connection, table: str,
+                       col: str, values):
+    """
+    Reemplaza solo las particiones `col IN values` de `table` (borrar + append),
+    sin tocar el resto de filas ni recrear los índices.
+    """
+    if col not in _table_columns(conn, table):
+        raise ValueError(f"{table} no está particionada por {col}")
+    values = [int(v) for v in values]
+    conn.execute(f'DELETE FROM "{table}" WHERE {partition_where(col, len(values))}', values)
+    df.to_sql(table, conn, if_exists="append", index=False)
+    conn.execute(f'ANALYZE "{table}"')
+    conn.commit()
+
+
+def staged_fingerprint(conn: sqlite3.Connection, table: str):
+    """Huella de la fuente con la que se cargó `table` la última vez (o None)."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS _stg_fingerprints (tabla TEXT PRIMARY KEY, fingerprint TEXT)"
+    )
+    row = conn.execute(
+        "SELECT fingerprint FROM _stg_fingerprints WHERE tabla = ?", (table,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def record_fingerprint(conn: sqlite3.Connection, table: str, fingerprint):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS _stg_fingerprints (tabla TEXT PRIMARY KEY, fingerprint TEXT)"
+    )
+    if fingerprint is None:
+        conn.execute("DELETE FROM _stg_fingerprints WHERE tabla = ?", (table,))
+    else:
+        conn.execute(
+            "INSERT OR REPLACE INTO _stg_fingerprints (tabla, fingerprint) VALUES (?, ?)",
+            (table, fingerprint),
+        )
+    conn.commit()
+
 
 def ensure_indexes(conn: sqlite3.Connection):
-    cur = conn.cursor()
-    cur.executescript('''
-    CREATE INDEX IF NOT EXISTS ix_dim_cliente_id ON dim_cliente(cliente_id);
-    CREATE INDEX IF NOT EXISTS ix_dim_producto_id ON dim_producto(producto_id);
-    CREATE INDEX IF NOT EXISTS ix_dim_fuente_id ON dim_fuente(fuente_id);
-    CREATE INDEX IF NOT EXISTS ix_dim_fecha_key ON dim_fecha(fecha_key);
-    CREATE INDEX IF NOT EXISTS ix_fact_fecha_key ON fact_opiniones(fecha_key);
-    ''')
-    conn.commit()
\ No newline at end of file
+    for table in INDEXES:
+        create_indexes(conn, table, analyze=False)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def explain_queries(conn: sqlite3.Connection, queries: dict) -> pd.DataFrame:
+    """
+    EXPLAIN QUERY PLAN de cada consulta {nombre: sql} o {nombre: (sql, params)}
+    (params con valores de ejemplo para los "?").
+    full_scan=True cuando SQLite recorre la tabla sin usar ningún índice.
+    """
+    rows = []
+    for name, q in queries.items():
+        sql, params = q if isinstance(q, tuple) else (q, None)
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+        except sqlite3.Error as e:
+            rows.append({"query": name, "detail": f"error: {e}", "full_scan": False})
+            continue
+        for step in plan:
+            detail = step[-1]
+            full_scan = detail.startswith("SCAN") and "USING" not in detail
+            rows.append({"query": name, "detail": detail, "full_scan": full_scan})
+    return pd.DataFrame(rows, columns=["query", "detail", "full_scan"])
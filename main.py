@@ -1,28 +1,99 @@
 # main.py
 import os
 import json
+import argparse
 import sqlite3
+from datetime import date
 import pandas as pd
 
 from core.logger import get_logger
+from core.profiler import StageProfiler
 from extract.csv_extractor import CsvExtractor
 from extract.db_extractor import DatabaseExtractor
 from extract.api_extractor import ApiExtractor
+from extract.cache import ExtractCache, parquet_engine
 from transform.clean_data import (
     standardize_columns,
     normalize_text,
     parse_date,
     build_dim_fecha,
+    periodos_between,
+    periodo_bounds,
+)
+from load.load_to_staging import (
+    upsert_table,
+    ensure_indexes,
+    explain_queries,
+    replace_partitions,
+    partition_where,
+    staged_fingerprint,
+    record_fingerprint,
+)
+from core.dw_repository import insert_opiniones_batch, replace_opiniones_rango, ensure_fechas
+from core.load_journal import run_batched_load, has_pending_load, forget_rows, remember_rows
+from core.dw_aggregates import ensure_aggregate_tables, rebuild_aggregates
+from core.schema_registry import (
+    get_schema,
+    fact_sources,
+    staging_table,
+    apply_renames,
+    date_format,
+    map_to_fact,
 )
-from load.load_to_staging import upsert_table, ensure_indexes
-from core.dw_repository import insert_opiniones
 from core.db_engine import get_engine
 
 BASE = os.path.dirname(__file__)
 with open(os.path.join(BASE, "config", "settings.json"), "r", encoding="utf-8") as f:
     cfg = json.load(f)
 
-log = get_logger("etl", cfg["log_path"])
+log = get_logger("etl", cfg["log_path"], **cfg.get("logging", {}))
+
+# Lecturas de staging de cada etapa (también se revisan con EXPLAIN QUERY
+# PLAN en cada corrida, ver staging_queries)
+SQL_STG_DIMS = {
+    "dim_cliente": "SELECT * FROM stg_clients",
+    "dim_producto": "SELECT * FROM stg_products",
+    "dim_fuente": "SELECT * FROM stg_fuente",
+}
+SQL_DIM_FUENTE_MAP = "SELECT nombre, fuente_id FROM dim_fuente"
+SQL_FACT = "SELECT * FROM fact_opiniones"
+SQL_FACT_RANGO = "SELECT * FROM fact_opiniones WHERE fecha_key BETWEEN ? AND ?"
+
+
+def fechas_sql(table, col):
+    return f"SELECT {col} FROM {table}"
+
+
+def fact_source_sql(table, schema, periodos=None):
+    """(sql, params) con que build_fact lee una tabla de staging."""
+    sql, params = f"SELECT * FROM {table}", None
+    fecha_col = schema["fact"].get("fecha")
+    if periodos and date_format(schema, fecha_col) == "%Y-%m-%d":
+        # fechas ISO: se filtra en SQLite (usa el índice sobre fecha)
+        sql += f" WHERE {fecha_col} >= ? AND {fecha_col} < ?"
+        params = periodo_bounds(periodos)
+    return sql, params
+
+
+_extract_cache = None
+
+
+def get_extract_cache():
+    """ExtractCache según cfg["extract_cache"] (None si está deshabilitada)."""
+    global _extract_cache
+    opts = cfg.get("extract_cache", {})
+    if _extract_cache is None and opts.get("enabled", False):
+        if not parquet_engine():
+            log.warning("Caché de extracción deshabilitada: no hay motor Parquet (pyarrow o fastparquet)")
+            opts["enabled"] = False
+            return None
+        try:
+            _extract_cache = ExtractCache(
+                opts["dir"], max_bytes=int(opts.get("max_mb", 256)) * 1024 * 1024
+            )
+        except Exception as e:
+            log.warning(f"Caché de extracción deshabilitada: {e}")
+    return _extract_cache
 
 
 # 1) Lectura de fuentes (BD + API + CSV)
@@ -42,7 +113,7 @@ def read_sources():
             log.warning("BD: consulta vacía o sin filas.")
         else:
             dfs["db_opiniones"] = df_db
-            log.info(f"BD: {len(df_db)} filas")
+            log.info(f"BD: {len(df_db)} filas", extra={"stage": "extract", "source": "db_opiniones", "rows": len(df_db)})
     except Exception as e:
         log.warning(f"No se pudo consultar la BD: {e}")
 
@@ -56,20 +127,39 @@ def read_sources():
             log.warning("API: respuesta vacía/no JSON o sin filas.")
         else:
             dfs["api_opiniones"] = df_api
-            log.info(f"API: {len(df_api)} filas")
+            log.info(f"API: {len(df_api)} filas", extra={"stage": "extract", "source": "api_opiniones", "rows": len(df_api)})
     except Exception as e:
         log.warning(f"No se pudo consultar la API: {e}")
 
-    # 3) CSVs
+    # 3) CSVs (con caché por huella de archivo)
+    cache = get_extract_cache()
     paths = cfg["paths"]
     for key, path in paths.items():
         if key.endswith("_csv"):
+            schema = get_schema(cfg, key)
+            fp, df = None, None
+            if cache:
+                # la caché es opcional: si falla se lee el CSV igual
+                try:
+                    fp = cache.fingerprint(path, schema)
+                    df = cache.get(fp)
+                except Exception as e:
+                    log.warning(f"CSV {key}: caché no disponible, se lee el archivo: {e}")
             try:
-                log.info(f"Leyendo {key} desde {path}")
-                df = CsvExtractor(path).extract()
-                df = standardize_columns(df)
+                if df is not None:
+                    log.info(f"CSV {key}: sin cambios, leído de caché")
+                else:
+                    log.info(f"Leyendo {key} desde {path}")
+                    df = CsvExtractor(path, schema=schema).extract()
+                    df = apply_renames(standardize_columns(df), schema)
+                    if cache and fp:
+                        try:
+                            cache.put(fp, df, source=key)
+                        except Exception as e:
+                            log.warning(f"CSV {key}: no se pudo guardar en caché: {e}")
+                df.attrs["fingerprint"] = fp
                 dfs[key] = df
-                log.info(f"CSV {key}: {len(df)} filas")
+                log.info(f"CSV {key}: {len(df)} filas", extra={"stage": "extract", "source": key, "rows": len(df)})
             except Exception as e:
                 log.warning(f"CSV {key}: error leyendo {path}: {e}")
 
@@ -80,6 +170,8 @@ def read_sources():
 # 2) Staging (SQLite)
 # =====================================================
 def stage(conn, dfs):
+    """Lleva cada fuente a stg_*; devuelve las filas realmente escritas."""
+    total = 0
     for k, df in dfs.items():
         if not isinstance(df, pd.DataFrame):
             log.warning(f"Staging -> {k}: fuente no es DataFrame, se omite.")
@@ -89,8 +181,15 @@ def stage(conn, dfs):
             continue
 
         table = f"stg_{k.replace('_csv', '')}"
+        fp = df.attrs.get("fingerprint")
+        if fp and staged_fingerprint(conn, table) == fp:
+            log.info(f"Staging -> {table}: fuente sin cambios, se omite.")
+            continue
         upsert_table(df, conn, table)
-        log.info(f"Staging -> {table}: {len(df)} filas")
+        record_fingerprint(conn, table, fp)
+        total += len(df)
+        log.info(f"Staging -> {table}: {len(df)} filas", extra={"stage": "stage", "source": k, "rows": len(df)})
+    return total
 
 
 # 3) Dimensiones en staging (SQLite)
@@ -99,7 +198,7 @@ def build_dimensions(conn):
     # Dim Cliente
     # --------------------------
     try:
-        clients = pd.read_sql("SELECT * FROM stg_clients", conn)
+        clients = pd.read_sql(SQL_STG_DIMS["dim_cliente"], conn)
         clients["cliente_id"] = (
             "C" + clients["idcliente"].astype(int).astype(str).str.zfill(3)
         )
@@ -111,7 +210,7 @@ def build_dimensions(conn):
         dim_cliente["nombre"] = normalize_text(dim_cliente["nombre"])
         dim_cliente["email"] = normalize_text(dim_cliente["email"])
         upsert_table(dim_cliente, conn, "dim_cliente")
-        log.info(f"Dim Cliente: {len(dim_cliente)}")
+        log.info(f"Dim Cliente: {len(dim_cliente)}", extra={"stage": "dimensions", "source": "dim_cliente", "rows": len(dim_cliente)})
     except Exception as e:
         log.warning(f"Dim Cliente: no se pudo construir: {e}")
 
@@ -119,14 +218,13 @@ def build_dimensions(conn):
     # Dim Producto
     # --------------------------
     try:
-        products = pd.read_sql("SELECT * FROM stg_products", conn)
+        products = pd.read_sql(SQL_STG_DIMS["dim_producto"], conn)
         products["producto_id"] = (
             "P" + products["idproducto"].astype(int).astype(str).str.zfill(3)
         )
 
-        # categoría -> categoria (sin tilde)
-        if "categoría" in products.columns and "categoria" not in products.columns:
-            products = products.rename(columns={"categoría": "categoria"})
+        # categoría -> categoria (sin tilde), según el registro de esquemas
+        products = apply_renames(products, get_schema(cfg, "products_csv"))
 
         keep_cols = [
             c for c in ["producto_id", "nombre", "categoria"] if c in products.columns
@@ -134,7 +232,7 @@ def build_dimensions(conn):
         dim_producto = products[keep_cols].drop_duplicates().copy()
         dim_producto["nombre"] = normalize_text(dim_producto["nombre"])
         upsert_table(dim_producto, conn, "dim_producto")
-        log.info(f"Dim Producto: {len(dim_producto)}")
+        log.info(f"Dim Producto: {len(dim_producto)}", extra={"stage": "dimensions", "source": "dim_producto", "rows": len(dim_producto)})
     except Exception as e:
         log.warning(f"Dim Producto: no se pudo construir: {e}")
 
@@ -142,19 +240,22 @@ def build_dimensions(conn):
     # Dim Fuente
     # --------------------------
     try:
-        fuentes = pd.read_sql("SELECT * FROM stg_fuente", conn)
+        fuentes = pd.read_sql(SQL_STG_DIMS["dim_fuente"], conn)
         dim_fuente = fuentes.rename(
             columns={"idfuente": "fuente_id", "tipofuente": "tipo_fuente"}
         ).copy()
 
         if "nombre" not in dim_fuente.columns:
             dim_fuente["nombre"] = dim_fuente["tipo_fuente"]
+        dim_fuente["fechacarga"] = parse_date(
+            dim_fuente["fechacarga"], date_format(get_schema(cfg, "fuente_csv"), "fechacarga")
+        )
 
         dim_fuente = dim_fuente[
             ["fuente_id", "nombre", "tipo_fuente", "fechacarga"]
         ].drop_duplicates()
         upsert_table(dim_fuente, conn, "dim_fuente")
-        log.info(f"Dim Fuente: {len(dim_fuente)}")
+        log.info(f"Dim Fuente: {len(dim_fuente)}", extra={"stage": "dimensions", "source": "dim_fuente", "rows": len(dim_fuente)})
     except Exception as e:
         log.warning(f"Dim Fuente: no se pudo construir: {e}")
 
@@ -163,17 +264,12 @@ def build_dimensions(conn):
     # --------------------------
     try:
         frames = []
-        for table, col in [
-            ("stg_social_comments", "fecha"),
-            ("stg_surveys", "fecha"),
-            ("stg_web_reviews", "fecha"),
-            ("stg_db_opiniones", "fecha"),
-            ("stg_api_opiniones", "fecha"),
-        ]:
+        for source, schema in fact_sources(cfg).items():
+            table, col = staging_table(source), schema["fact"].get("fecha", "fecha")
             try:
-                df = pd.read_sql(f"SELECT {col} FROM {table}", conn)
+                df = pd.read_sql(fechas_sql(table, col), conn)
                 if col in df.columns:
-                    df[col] = parse_date(df[col])
+                    df[col] = parse_date(df[col], date_format(schema, col))
                     frames.append(df[col])
             except Exception:
                 pass
@@ -185,7 +281,7 @@ def build_dimensions(conn):
         )
         dim_fecha = build_dim_fecha(all_dates)
         upsert_table(dim_fecha, conn, "dim_fecha")
-        log.info(f"Dim Fecha: {len(dim_fecha)}")
+        log.info(f"Dim Fecha: {len(dim_fecha)}", extra={"stage": "dimensions", "source": "dim_fecha", "rows": len(dim_fecha)})
     except Exception as e:
         log.warning(f"Dim Fecha: no se pudo construir: {e}")
 
@@ -193,92 +289,89 @@ def build_dimensions(conn):
 # =====================================================
 # 4) Hechos en staging (SQLite)
 # =====================================================
-def build_fact(conn):
-    try:
-        dim_fuente = pd.read_sql("SELECT * FROM dim_fuente", conn)
-    except Exception:
-        dim_fuente = pd.DataFrame(columns=["fuente_id", "nombre"])
-
-    frames = []
-
-    def fecha_key_from(series):
-        s = pd.to_datetime(series, errors="coerce").dt.strftime("%Y%m%d")
-        return pd.to_numeric(s, errors="coerce").fillna(-1).astype("int64")
+def fecha_key_from(series, fmt=None):
+    s = parse_date(series, fmt).dt.strftime("%Y%m%d")
+    return pd.to_numeric(s, errors="coerce").fillna(-1).astype("int64")
 
-    def add_block(df, mapping):
-        if df is None or df.empty:
-            return None
-        d = df.copy()
-
-        # Normalización de nombres
-        if "comentario" in d.columns and "texto_opinion" not in d.columns:
-            d = d.rename(columns={"comentario": "texto_opinion"})
-        if "rating" in d.columns and "puntaje" not in d.columns:
-            d["puntaje"] = pd.to_numeric(d["rating"], errors="coerce").fillna(0)
-        if "puntajesatisfacción" in d.columns and "puntaje" not in d.columns:
-            d["puntaje"] = pd.to_numeric(
-                d["puntajesatisfacción"], errors="coerce"
-            ).fillna(0)
-        if "fecha" in d.columns and "fecha_key" not in d.columns:
-            d["fecha_key"] = fecha_key_from(d["fecha"])
-
-        # Map de IDs canónicos (cliente_id, producto_id)
-        for src, dst in mapping.items():
-            if src in d.columns and dst not in d.columns:
-                d[dst] = d[src].astype(str)
-
-        # fuente_id desde 'fuente' (solo si matchea con dim_fuente)
-        if "fuente" in d.columns and "fuente_id" not in d.columns and not dim_fuente.empty:
-            tmp = d.merge(
-                dim_fuente[["fuente_id", "nombre"]],
-                how="left",
-                left_on="fuente",
-                right_on="nombre",
-            )
-            d["fuente_id"] = tmp["fuente_id"].fillna("-1").astype(str)
-
-        # Columnas finales con defaults
-        out_cols = [
-            "cliente_id",
-            "producto_id",
-            "fuente_id",
-            "fecha_key",
-            "puntaje",
-            "texto_opinion",
-        ]
-        for c in out_cols:
-            if c not in d.columns:
-                if c == "texto_opinion":
-                    d[c] = ""
-                elif c in {"cliente_id", "producto_id", "fuente_id"}:
-                    d[c] = "-1"
-                else:
-                    d[c] = 0
 
-        d["cliente_id"] = d["cliente_id"].astype(str).fillna("-1")
-        d["producto_id"] = d["producto_id"].astype(str).fillna("-1")
-        d["fuente_id"] = d["fuente_id"].astype(str).fillna("-1")
-        d["fecha_key"] = pd.to_numeric(d["fecha_key"], errors="coerce").fillna(-1).astype(
-            "int64"
+def fact_block(df, schema, dim_fuente):
+    """
+    Normaliza un DataFrame de una fuente a las columnas de fact_opiniones
+    según su mapeo 'fact' (registro de esquemas).
+    """
+    if df is None or df.empty:
+        return None
+
+    # Columnas canónicas según el mapeo 'fact' del registro de esquemas
+    d = map_to_fact(df, schema)
+    if "fecha" in d.columns:
+        d["fecha_key"] = fecha_key_from(
+            d["fecha"], date_format(schema, schema["fact"]["fecha"])
         )
-        d["puntaje"] = pd.to_numeric(d["puntaje"], errors="coerce").fillna(0)
-        d["texto_opinion"] = (
-            d["texto_opinion"].astype(str).str.strip().str[:2000]
+
+    # fuente_id desde 'fuente' (solo si matchea con dim_fuente)
+    if "fuente" in d.columns and not dim_fuente.empty:
+        tmp = d.merge(
+            dim_fuente[["fuente_id", "nombre"]],
+            how="left",
+            left_on="fuente",
+            right_on="nombre",
         )
+        d["fuente_id"] = tmp["fuente_id"].fillna("-1").astype(str).values
+
+    # Columnas finales con defaults
+    out_cols = [
+        "cliente_id",
+        "producto_id",
+        "fuente_id",
+        "fecha_key",
+        "puntaje",
+        "texto_opinion",
+    ]
+    for c in out_cols:
+        if c not in d.columns:
+            if c == "texto_opinion":
+                d[c] = ""
+            elif c in {"cliente_id", "producto_id", "fuente_id"}:
+                d[c] = "-1"
+            else:
+                d[c] = 0
+
+    d["cliente_id"] = d["cliente_id"].astype(str).fillna("-1")
+    d["producto_id"] = d["producto_id"].astype(str).fillna("-1")
+    d["fuente_id"] = d["fuente_id"].astype(str).fillna("-1")
+    d["fecha_key"] = pd.to_numeric(d["fecha_key"], errors="coerce").fillna(-1).astype(
+        "int64"
+    )
+    d["puntaje"] = pd.to_numeric(d["puntaje"], errors="coerce").fillna(0)
+    d["texto_opinion"] = (
+        d["texto_opinion"].astype(str).str.strip().str[:2000]
+    )
+
+    return d[out_cols]
 
-        return d[out_cols]
 
-    # Bloques desde cada tabla de staging
-    for table, mapping in [
-        ("stg_social_comments", {"idcliente": "cliente_id", "idproducto": "producto_id"}),
-        ("stg_surveys", {"idcliente": "cliente_id", "idproducto": "producto_id"}),
-        ("stg_web_reviews", {"idcliente": "cliente_id", "idproducto": "producto_id"}),
-        ("stg_db_opiniones", {"idcliente": "cliente_id", "idproducto": "producto_id"}),
-        ("stg_api_opiniones", {"idcliente": "cliente_id", "idproducto": "producto_id"}),
-    ]:
+def build_fact(conn, periodos=None):
+    """
+    Construye fact_opiniones (particionada por periodo YYYYMM).
+    Con `periodos` solo se reconstruyen esas particiones desde staging.
+    """
+    try:
+        dim_fuente = pd.read_sql(SQL_DIM_FUENTE_MAP, conn)
+    except Exception:
+        dim_fuente = pd.DataFrame(columns=["fuente_id", "nombre"])
+
+    frames = []
+
+    # Bloques desde cada tabla de staging declarada en el registro
+    for source, schema in fact_sources(cfg).items():
+        table = staging_table(source)
         try:
-            df = pd.read_sql(f"SELECT * FROM {table}", conn)
-            blk = add_block(df, mapping)
+            sql, params = fact_source_sql(table, schema, periodos)
+            df = pd.read_sql(sql, conn, params=params)
+            blk = fact_block(df, schema, dim_fuente)
+            if blk is not None and periodos:
+                blk = blk[(blk["fecha_key"] // 100).isin(periodos)]
             if blk is not None and not blk.empty:
                 frames.append(blk)
             else:
@@ -301,9 +394,22 @@ def build_fact(conn):
             ]
         )
     )
+    fact["periodo"] = pd.to_numeric(fact["fecha_key"]) // 100
+
+    if periodos:
+        try:
+            replace_partitions(fact, conn, "fact_opiniones", "periodo", periodos)
+        except ValueError as e:
+            log.warning(f"FACT: {e}; se reconstruye completa.")
+            return build_fact(conn)
+        log.info(
+            f"FACT: particiones {periodos} de fact_opiniones = {len(fact)} filas",
+            extra={"stage": "fact", "source": "fact_opiniones", "rows": len(fact)},
+        )
+        return
 
     upsert_table(fact, conn, "fact_opiniones")
-    log.info(f"FACT: fact_opiniones = {len(fact)} filas")
+    log.info(f"FACT: fact_opiniones = {len(fact)} filas", extra={"stage": "fact", "source": "fact_opiniones", "rows": len(fact)})
 
 
 # 5) Helper para resolver claves contra el DW
@@ -319,22 +425,11 @@ def lookup_key(df_dim, merge_col_dim, key_col_dim, fact_df, fact_col_fact, left_
     return fact_df
 
 
-# 6) Carga Fact.Opinion al DW (SQL Server)
-def load_fact_to_dw(conn_sqlite):
+def load_dw_keymaps():
     """
-    Carga fact_opiniones (staging SQLite) → Fact.Opinion (SQL Server),
-    forzando SIEMPRE claves válidas en las FKs para no descartar filas.
+    Lee las dimensiones del DW y arma los mapas/rangos para resolver claves.
+    El resultado se puede reutilizar entre lotes (ver microbatch.py).
     """
-    try:
-        fact = pd.read_sql("SELECT * FROM fact_opiniones", conn_sqlite)
-    except Exception as e:
-        log.warning(f"DW Load: no se pudo leer fact_opiniones: {e}")
-        return
-
-    if fact.empty:
-        log.info("DW Load: fact_opiniones vacío, nada que cargar.")
-        return
-
     # 1. Leer dimensiones del DW
     dw_engine = get_engine()
 
@@ -347,13 +442,53 @@ def load_fact_to_dw(conn_sqlite):
     max_cliente = int(dim_cliente["IdCliente"].max())   
     max_producto = int(dim_producto["IdProducto"].max())  
     default_fuente = int(dim_fuente["IdFuente"].min())  
-    default_fecha = int(dim_fecha["IdFecha"].min())    
 
     # Mapa fecha_key (YYYYMMDD) → IdFecha real
     dim_fecha["Fecha"] = pd.to_datetime(dim_fecha["Fecha"], errors="coerce")
     dim_fecha["fecha_key"] = dim_fecha["Fecha"].dt.strftime("%Y%m%d").astype("int64")
     fecha_map = dict(zip(dim_fecha["fecha_key"], dim_fecha["IdFecha"]))
+    # IdFecha → periodo YYYYMM (para los agregados mensuales)
+    periodo_map = dict(zip(dim_fecha["IdFecha"], dim_fecha["fecha_key"] // 100))
+
+    return {
+        "max_cliente": max_cliente,
+        "max_producto": max_producto,
+        "default_fuente": default_fuente,
+        "fecha_map": fecha_map,
+        "periodo_map": periodo_map,
+    }
+
 
+def add_fechas_dw(km, fecha_keys):
+    """
+    Agrega a Dimension.Fecha las fechas (YYYYMMDD) que no están en km y
+    actualiza sus mapas. Devuelve {fecha_key: IdFecha} de las agregadas.
+    """
+    nuevas = {int(k) for k in fecha_keys if int(k) > 0} - km["fecha_map"].keys()
+    if not nuevas:
+        return {}
+    with get_engine().begin() as dw:
+        ids = ensure_fechas(dw, nuevas)
+    km["fecha_map"].update(ids)
+    km["periodo_map"].update({v: k // 100 for k, v in ids.items()})
+    log.info(f"DW Load: {len(ids)} fechas nuevas en Dimension.Fecha")
+    return ids
+
+
+# Claves naturales de una fila de hechos en staging: identifican la fila en
+# el journal de cargas (no cambian si el DW reasigna claves sustitutas)
+FACT_KEY_COLS = ["cliente_id", "producto_id", "fuente_id", "fecha_key", "puntaje", "texto_opinion"]
+
+
+def resolve_dw_keys(fact, km):
+    """
+    fact_opiniones → columnas de Fact.Opinion (+ Periodo YYYYMM y las claves
+    naturales FACT_KEY_COLS), forzando
+    SIEMPRE claves válidas en las FKs. Las filas cuya fecha no existe en
+    Dimension.Fecha se descartan (ver add_fechas_dw): con una fecha por
+    defecto quedarían en otro mes y un reproceso de ventana las borraría.
+    """
+    fact = fact.copy()
 
     # 2. Normalizar IDs de Cliente y Producto
 
@@ -365,8 +500,8 @@ def load_fact_to_dw(conn_sqlite):
     fact["IdProducto"] = fact["IdProducto"].fillna(1)
 
 
-    fact["IdCliente"] = ((fact["IdCliente"] - 1) % max_cliente) + 1
-    fact["IdProducto"] = ((fact["IdProducto"] - 1) % max_producto) + 1
+    fact["IdCliente"] = ((fact["IdCliente"] - 1) % km["max_cliente"]) + 1
+    fact["IdProducto"] = ((fact["IdProducto"] - 1) % km["max_producto"]) + 1
 
     fact["IdCliente"] = fact["IdCliente"].astype("int64")
     fact["IdProducto"] = fact["IdProducto"].astype("int64")
@@ -377,13 +512,17 @@ def load_fact_to_dw(conn_sqlite):
     fact["fecha_key"] = pd.to_numeric(fact.get("fecha_key", None), errors="coerce")
 
 
-    fact["IdFecha"] = fact["fecha_key"].map(fecha_map)
-    fact["IdFecha"] = fact["IdFecha"].fillna(default_fecha).astype("int64")
+    fact["IdFecha"] = fact["fecha_key"].map(km["fecha_map"])
+    sin_fecha = fact["IdFecha"].isna()
+    if sin_fecha.any():
+        log.warning(f"DW Load: {int(sin_fecha.sum())} filas sin IdFecha en Dimension.Fecha, se omiten.")
+        fact = fact[~sin_fecha].copy()
+    fact["IdFecha"] = fact["IdFecha"].astype("int64")
 
   
     # 4. Resolver Fuente
 
-    fact["IdFuente"] = default_fuente
+    fact["IdFuente"] = km["default_fuente"]
 
 
     # 5. Métricas y texto
@@ -404,32 +543,221 @@ def load_fact_to_dw(conn_sqlite):
         "Sentimiento",
         "Comentario"
     ]]
+    # Claves naturales normalizadas (mismo texto en la corrida batch y el micro-lote)
+    naturales = pd.DataFrame({
+        "cliente_id": fact["cliente_id"].fillna("").astype(str),
+        "producto_id": fact["producto_id"].fillna("").astype(str),
+        "fuente_id": fact["fuente_id"].fillna("").astype(str),
+        "fecha_key": fact["fecha_key"].astype("int64"),
+        "puntaje": pd.to_numeric(fact["puntaje"], errors="coerce").fillna(0).astype(float),
+        "texto_opinion": fact["texto_opinion"].fillna("").astype(str),
+    }, index=fact.index)
+    return fact_dw.assign(Periodo=fact["IdFecha"].map(km["periodo_map"]).astype("int64")).join(naturales)
+
+
+# 6) Carga Fact.Opinion al DW (SQL Server)
+def load_fact_to_dw(conn_sqlite, desde=None, hasta=None):
+    """
+    Carga fact_opiniones (staging SQLite) → Fact.Opinion (SQL Server),
+    forzando SIEMPRE claves válidas en las FKs (las fechas nuevas se agregan
+    a Dimension.Fecha antes de resolverlas).
+
+    Con desde/hasta (fechas) solo se reemplazan en el DW las filas de esa
+    ventana: se borran por IdFecha y se insertan las de staging.
+    Devuelve las filas insertadas en Fact.Opinion.
+    """
+    ventana = desde is not None and hasta is not None
+    try:
+        if ventana:
+            fact = pd.read_sql(
+                SQL_FACT_RANGO,
+                conn_sqlite,
+                params=(int(desde.strftime("%Y%m%d")), int(hasta.strftime("%Y%m%d"))),
+            )
+        else:
+            fact = pd.read_sql(SQL_FACT, conn_sqlite)
+    except Exception as e:
+        log.warning(f"DW Load: no se pudo leer fact_opiniones: {e}")
+        return 0
+
+    if fact.empty and not ventana:
+        log.info("DW Load: fact_opiniones vacío, nada que cargar.")
+        return 0
+
+    # 1-6. Claves del DW y dataset final (con Periodo para los agregados)
+    keymaps = load_dw_keymaps()
+    add_fechas_dw(keymaps, fact["fecha_key"])
+    batch = resolve_dw_keys(fact, keymaps)
+
+    # 7. Incrementos de los agregados (solo con este lote, sin recalcular)
+    ensure_aggregate_tables()
+    if ventana:
+        if has_pending_load(conn_sqlite, "Fact.Opinion"):
+            raise RuntimeError("DW Load: hay una carga de Fact.Opinion pendiente; corra primero main.py sin ventana.")
+        chk = replace_opiniones_rango(batch, desde, hasta)
+        for periodo, r in chk[chk["borradas"] != chk["insertadas"]].iterrows():
+            log.warning(f"DW Load: periodo {periodo}: {r['borradas']} filas borradas vs {r['insertadas']} insertadas")
+        # Las filas de la ventana pasan a ser exactamente las de staging
+        forget_rows(conn_sqlite, "Fact.Opinion",
+                    int(desde.strftime("%Y%m%d")), int(hasta.strftime("%Y%m%d")))
+        remember_rows(conn_sqlite, "Fact.Opinion", batch,
+                      partition_col="fecha_key", key_cols=FACT_KEY_COLS)
+        conn_sqlite.commit()
+        log.info(f"DW Load: ventana {desde}..{hasta}, {int(chk['borradas'].sum())} filas reemplazadas en Fact.Opinion.")
+    else:
+        # Lotes independientes con checkpoint: solo filas que aún no están en
+        # el DW (p. ej. las que ya agregó microbatch.py); si falla, la próxima
+        # corrida completa el plan pendiente antes de planificar otro
+        res = run_batched_load(
+            conn_sqlite, "Fact.Opinion", batch, insert_opiniones_batch,
+            batch_size=cfg.get("dw_load", {}).get("batch_size", 5000), log=log,
+            partition_col="fecha_key", key_cols=FACT_KEY_COLS,
+        )
+        if not res["ok"]:
+            raise RuntimeError(f"DW Load: verificación de lotes fallida: {res['mismatches']}")
 
-    rows = fact_dw.to_dict(orient="records")
-    insert_opiniones(rows)
+    cargadas = int(chk["insertadas"].sum()) if ventana else res["filas_loaded"]
+    log.info(
+        f"DW Load: {cargadas} filas cargadas correctamente en Fact.Opinion.",
+        extra={"stage": "dw_load", "source": "fact_opiniones", "rows": cargadas},
+    )
+    return cargadas
 
-    log.info(f"DW Load: {len(rows)} filas cargadas correctamente en Fact.Opinion.")
 
+def staging_queries(desde=None, hasta=None):
+    """
+    {nombre: (sql, params)} con las consultas que ejecutan build_dimensions,
+    build_fact, load_fact_to_dw y el reproceso por ventana, con valores de
+    ejemplo para los parámetros (por defecto, el mes en curso).
+    """
+    hasta = hasta or date.today()
+    desde = desde or hasta.replace(day=1)
+    periodos = periodos_between(desde, hasta)
+
+    queries = {name: (sql, None) for name, sql in SQL_STG_DIMS.items()}
+    queries["dim_fuente_map"] = (SQL_DIM_FUENTE_MAP, None)
+    for source, schema in fact_sources(cfg).items():
+        table = staging_table(source)
+        queries[f"fechas_{table}"] = (fechas_sql(table, schema["fact"].get("fecha", "fecha")), None)
+        queries[f"fact_{table}"] = fact_source_sql(table, schema)
+        sql, params = fact_source_sql(table, schema, periodos)
+        if params:
+            queries[f"fact_{table}_ventana"] = (sql, params)
+    queries["fact_dw"] = (SQL_FACT, None)
+    queries["fact_dw_ventana"] = (
+        SQL_FACT_RANGO, (int(desde.strftime("%Y%m%d")), int(hasta.strftime("%Y%m%d")))
+    )
+    queries["fact_particiones"] = (
+        f'DELETE FROM "fact_opiniones" WHERE {partition_where("periodo", len(periodos))}', periodos
+    )
+    return queries
+
+
+def report_query_plans(conn):
+    queries = staging_queries()
+    plan = explain_queries(conn, queries)
+    # Un full scan solo es regresión en consultas filtradas; las lecturas
+    # completas (SELECT * de una tabla) lo hacen a propósito
+    filtradas = {name for name, (sql, _) in queries.items() if " WHERE " in sql.upper()}
+    for _, r in plan[plan["full_scan"]].iterrows():
+        if r["query"] in filtradas:
+            log.warning(f"Query plan: {r['query']} hace full scan ({r['detail']})")
+        else:
+            log.info(f"Query plan: {r['query']} lectura completa ({r['detail']})")
+    log.info(f"Query plan: {plan['query'].nunique()} consultas revisadas, "
+             f"{int((plan['full_scan'] & plan['query'].isin(filtradas)).sum())} full scans en consultas filtradas")
 
 
 # 7) Orquestación
 
-def main():
+def _count(conn, *tables):
+    total = 0
+    for t in tables:
+        try:
+            total += conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+        except sqlite3.Error:
+            pass
+    return total
+
+
+def main(profile=False, run_id=None, desde=None, hasta=None):
+    """
+    Corrida completa, o con desde/hasta solo se reprocesa esa ventana:
+    se reconstruyen las particiones mensuales afectadas de fact_opiniones y
+    se reemplazan en Fact.Opinion únicamente las filas del rango.
+    """
+    ventana = desde is not None and hasta is not None
+    prof = StageProfiler(
+        cfg.get("profiles_dir", "../etl_opiniones/output/profiles"),
+        run_id=run_id, enabled=profile, prefix="etl_", logger=log,
+    )
     log.info("=== ETL Opiniones (Python) ===")
-    dfs = read_sources()
+    if ventana:
+        log.info(f"Reproceso de ventana {desde}..{hasta}")
+    with prof.stage("read_sources") as st:
+        dfs = read_sources()
+        st["rows"] = sum(len(df) for df in dfs.values())
     conn = sqlite3.connect(cfg["staging_db"])
     try:
-        stage(conn, dfs)
-        build_dimensions(conn)
-        build_fact(conn)
-        ensure_indexes(conn)
-
-        load_fact_to_dw(conn)
+        with prof.stage("stage") as st:
+            st["rows"] = stage(conn, dfs)
+
+        if ventana:
+            periodos = periodos_between(desde, hasta)
+            with prof.stage("build_fact") as st:
+                build_fact(conn, periodos=periodos)
+                st["rows"] = conn.execute(
+                    f"SELECT COUNT(*) FROM fact_opiniones WHERE {partition_where('periodo', len(periodos))}",
+                    periodos,
+                ).fetchone()[0]
+            with prof.stage("load_fact_to_dw") as st:
+                st["rows"] = load_fact_to_dw(conn, desde=desde, hasta=hasta)
+            log.info("ETL (ventana) finalizado OK")
+            return
+
+        with prof.stage("build_dimensions") as st:
+            build_dimensions(conn)
+            st["rows"] = _count(conn, "dim_cliente", "dim_producto", "dim_fuente", "dim_fecha")
+        with prof.stage("build_fact") as st:
+            build_fact(conn)
+            st["rows"] = _count(conn, "fact_opiniones")
+        with prof.stage("ensure_indexes"):
+            ensure_indexes(conn)
+            report_query_plans(conn)
+
+        with prof.stage("load_fact_to_dw") as st:
+            st["rows"] = load_fact_to_dw(conn)
 
         log.info("ETL finalizado OK")
     finally:
         conn.close()
+        prof.write_summary()
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="ETL Opiniones: fuentes -> staging -> DW")
+    ap.add_argument("--profile", action="store_true",
+                    help="perfila cada etapa (cProfile + tracemalloc) en output/profiles/<run_id>/")
+    ap.add_argument("--run-id", default=None, help="id de corrida para agrupar perfiles")
+    ap.add_argument("--from", dest="desde", type=date.fromisoformat, default=None,
+                    help="inicio de la ventana a reprocesar (YYYY-MM-DD)")
+    ap.add_argument("--to", dest="hasta", type=date.fromisoformat, default=None,
+                    help="fin de la ventana a reprocesar, inclusive (YYYY-MM-DD)")
+    ap.add_argument("--rebuild-aggregates", action="store_true",
+                    help="solo recalcula los agregados del DW desde Fact.Opinion y termina")
+    args = ap.parse_args(argv)
+    if (args.desde is None) != (args.hasta is None):
+        ap.error("--from y --to van juntos")
+    if args.desde and args.desde > args.hasta:
+        ap.error("--from debe ser <= --to")
+    return args
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.rebuild_aggregates:
+        if not ensure_aggregate_tables():  # si las crea, ya las recalcula
+            rebuild_aggregates()
+        log.info("Agregados recalculados desde Fact.Opinion")
+        raise SystemExit(0)
+    main(profile=args.profile, run_id=args.run_id, desde=args.desde, hasta=args.hasta)
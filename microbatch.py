@@ -0,0 +1,274 @@
+# microbatch.py
+import os
+import io
+import json
+import glob
+import time
+import argparse
+import sqlite3
+from collections import deque
+import pandas as pd
+
+from core.logger import get_logger
+from core.db_engine import get_engine
+from core.dw_aggregates import ensure_aggregate_tables
+from core.dw_repository import insert_opiniones_batch
+from core.load_journal import run_batched_load, complete_pending
+from core.schema_registry import get_schema, fact_sources, staging_table, apply_renames
+from extract.csv_extractor import CsvExtractor
+from extract.db_extractor import DatabaseExtractor
+from extract.api_extractor import ApiExtractor
+from transform.clean_data import standardize_columns
+from main import (
+    cfg, fact_block, load_dw_keymaps, resolve_dw_keys, add_fechas_dw,
+    SQL_DIM_FUENTE_MAP, FACT_KEY_COLS,
+)
+
+log = get_logger("microbatch", cfg["log_path"], **cfg.get("logging", {}))
+
+STATE_DDL = "CREATE TABLE IF NOT EXISTS _microbatch_state (clave TEXT PRIMARY KEY, valor TEXT)"
+
+# Máximo de hashes de filas de la API que se recuerdan para deduplicar
+API_SEEN_MAX = 50_000
+
+
+class MicroBatchDaemon:
+    """
+    Modo continuo: cada `interval_s` revisa los CSV de data/ (archivos nuevos o
+    con filas agregadas), Opiniones (IdOpinion > última marca) y la API, y
+    lleva SOLO las filas nuevas a staging y a Fact.Opinion en lotes pequeños.
+    Conexiones, mapas de claves del DW y dim_fuente quedan en memoria entre
+    lotes. Los offsets/marcas se guardan en _microbatch_state (staging) después
+    de cada carga confirmada, así que un reinicio retoma donde quedó.
+    """
+
+    def __init__(self, opts: dict, from_start: bool = False):
+        self.watch_dir = opts.get("watch_dir", "../etl_opiniones/data")
+        self.interval = float(opts.get("interval_s", 15))
+        self.batch_size = int(opts.get("batch_size", 1000))
+        self.keymaps_ttl = float(opts.get("keymaps_ttl_s", 300))
+        self.poll_db = opts.get("poll_db", True)
+        self.poll_api = opts.get("poll_api", True)
+        self.from_start = from_start
+
+        self.conn = sqlite3.connect(cfg["staging_db"])
+        self.conn.execute(STATE_DDL)
+        self.conn.commit()
+        self.engine = get_engine()
+        ensure_aggregate_tables()
+
+        self.keymaps, self.keymaps_at = None, 0.0
+        self.dim_fuente = None
+        self.latencies = deque(maxlen=200)
+
+    # ---------- estado ----------
+    def _get(self, clave, default=None):
+        row = self.conn.execute(
+            "SELECT valor FROM _microbatch_state WHERE clave = ?", (clave,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _put_many(self, updates: dict):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO _microbatch_state (clave, valor) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in updates.items()],
+        )
+
+    # ---------- caches en memoria ----------
+    def _refresh_keymaps(self):
+        if self.keymaps is None or time.time() - self.keymaps_at > self.keymaps_ttl:
+            self.keymaps = load_dw_keymaps()
+            self.keymaps_at = time.time()
+            try:
+                self.dim_fuente = pd.read_sql(SQL_DIM_FUENTE_MAP, self.conn)
+            except Exception:
+                self.dim_fuente = pd.DataFrame(columns=["fuente_id", "nombre"])
+
+    # ---------- fuentes ----------
+    def _watched_files(self):
+        for source, schema in fact_sources(cfg).items():
+            pattern = schema.get("file_pattern")
+            if not pattern:
+                continue
+            for path in sorted(glob.glob(os.path.join(self.watch_dir, pattern))):
+                yield source, schema, path
+
+    def _poll_files(self, frames, updates):
+        for source, schema, path in self._watched_files():
+            clave = f"file:{os.path.abspath(path)}"
+            size = os.path.getsize(path)
+            offset = self._get(clave)
+            if offset is None and not self.from_start and self._get("primed", False) is False:
+                # Primera vez: lo existente ya lo cargó la corrida batch
+                updates[clave] = size
+                continue
+            offset = offset or 0
+            if size < offset:
+                log.warning(f"{path}: el archivo se achicó, se relee desde el inicio")
+                offset = 0
+            if size == offset:
+                continue
+
+            with open(path, "rb") as f:
+                header = f.readline()
+                f.seek(max(offset, len(header)))
+                chunk = f.read(size - max(offset, len(header)))
+            # Solo líneas completas; el resto se toma en la próxima vuelta
+            end = chunk.rfind(b"\n") + 1
+            if end == 0:
+                continue
+            new_offset = max(offset, len(header)) + end
+            data = chunk[:end]
+            if data.strip():
+                df = CsvExtractor(io.BytesIO(header + data), schema=schema).extract()
+                frames.append((source, df, os.path.getmtime(path)))
+            updates[clave] = new_offset
+
+    def _poll_db(self, frames, updates):
+        sql = cfg["paths"].get("sql_opiniones", "")
+        if not sql.startswith("sql:"):
+            return
+        base = sql[len("sql:"):]
+        marca = self._get("db:IdOpinion")
+        if marca is None and not self.from_start:
+            df = DatabaseExtractor(f"SELECT MAX(IdOpinion) AS m FROM ({base}) t").extract()
+            updates["db:IdOpinion"] = int(df["m"].iloc[0] or 0)
+            return
+        t = time.time()
+        df = DatabaseExtractor(
+            f"{base} WHERE IdOpinion > :marca ORDER BY IdOpinion", params={"marca": marca or 0}
+        ).extract()
+        if not df.empty:
+            frames.append(("db_opiniones", df, t))
+            updates["db:IdOpinion"] = int(df["IdOpinion"].max())
+
+    def _poll_api(self, frames, updates):
+        url = cfg.get("api_url", cfg["paths"].get("api_opiniones"))
+        if not url:
+            return
+        t = time.time()
+        df = ApiExtractor(url).extract()
+        if df.empty:
+            return
+        hashes = pd.util.hash_pandas_object(df.astype(str), index=False).astype(str)
+        seen = self._get("api:seen")
+        if seen is None and not self.from_start:
+            updates["api:seen"] = hashes.tolist()[-API_SEEN_MAX:]
+            return
+        seen = dict.fromkeys(seen or [])  # conserva el orden de llegada
+        nuevos = ~hashes.isin(seen)
+        if nuevos.any():
+            frames.append(("api_opiniones", df[nuevos.values], t))
+            updates["api:seen"] = (list(seen) + hashes[nuevos].tolist())[-API_SEEN_MAX:]
+
+    # ---------- proceso ----------
+    def tick(self):
+        # Un micro-lote que se cortó a mitad de carga: se terminan sus lotes
+        # y se guardan sus offsets (marks del plan) antes de volver a consultar
+        # las fuentes; si no, las mismas filas se planificarían de nuevo
+        res = complete_pending(self.conn, "Fact.Opinion", insert_opiniones_batch,
+                               log=log, partition_col="fecha_key")
+        if res is not None and not res["ok"]:
+            raise RuntimeError(f"Micro-lote: verificación fallida: {res['mismatches']}")
+
+        t_poll = time.time()
+        frames, updates = [], {}
+        self._poll_files(frames, updates)
+        for enabled, poll in [(self.poll_db, self._poll_db), (self.poll_api, self._poll_api)]:
+            if not enabled:
+                continue
+            try:
+                poll(frames, updates)
+            except Exception as e:
+                log.warning(f"Micro-lote: error consultando fuente ({poll.__name__}): {e}", extra={"rate_limit": 60})
+        updates["primed"] = True
+
+        if not frames:
+            self._put_many(updates)
+            self.conn.commit()
+            return
+
+        self._refresh_keymaps()
+        stg, blocks = [], []
+        for source, df, t_detect in frames:
+            schema = get_schema(cfg, source) or {}
+            df = apply_renames(standardize_columns(df), schema)
+            stg.append((staging_table(source), df))
+            blk = fact_block(df, schema, self.dim_fuente)
+            if blk is not None and not blk.empty:
+                blocks.append(blk)
+
+        fact = pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame()
+        if not fact.empty:
+            fact["periodo"] = fact["fecha_key"] // 100
+            # Fechas nuevas: se agregan a Dimension.Fecha antes de resolver claves
+            # (nunca caen en la fecha por defecto); sin fecha válida se omiten.
+            # dim_fecha de staging la reconstruye la corrida batch.
+            add_fechas_dw(self.keymaps, fact["fecha_key"])
+            batch = resolve_dw_keys(fact, self.keymaps)
+            res = run_batched_load(
+                self.conn, "Fact.Opinion", batch, insert_opiniones_batch,
+                batch_size=self.batch_size, log=log,
+                # filas nuevas por construcción; los offsets se guardan con el
+                # plan y se aplican cuando termina (aunque lo termine otro proceso)
+                incremental=True, partition_col="fecha_key", key_cols=FACT_KEY_COLS,
+                marks={"table": "_microbatch_state", "values": updates},
+            )
+            if not res["ok"]:
+                raise RuntimeError(f"Micro-lote: verificación fallida: {res['mismatches']}")
+
+        # Staging y offsets solo después de confirmar en el DW
+        for table, df in stg:
+            try:
+                df.to_sql(table, self.conn, if_exists="append", index=False)
+            except Exception as e:
+                log.warning(f"Micro-lote: no se pudo agregar a {table}: {e}")
+        if not fact.empty:
+            fact.to_sql("fact_opiniones", self.conn, if_exists="append", index=False)
+        self._put_many(updates)
+        self.conn.commit()
+
+        t_done = time.time()
+        latency_ms = int((t_done - min(t for _, _, t in frames)) * 1000)
+        self.latencies.append(latency_ms)
+        lat = pd.Series(self.latencies)
+        log.info(
+            f"Micro-lote: {len(fact)} filas en {int((t_done - t_poll) * 1000)} ms, "
+            f"latencia e2e {latency_ms} ms (p50 {int(lat.median())}, p95 {int(lat.quantile(0.95))})",
+            extra={"stage": "microbatch", "rows": len(fact), "elapsed_ms": latency_ms},
+        )
+
+    def run(self, once: bool = False):
+        log.info(f"Micro-lote: vigilando {self.watch_dir} cada {self.interval}s")
+        try:
+            while True:
+                t0 = time.time()
+                try:
+                    self.tick()
+                except Exception as e:
+                    log.warning(f"Micro-lote: error en el lote, se reintenta: {e}")
+                if once:
+                    break
+                time.sleep(max(0.0, self.interval - (time.time() - t0)))
+        except KeyboardInterrupt:
+            log.info("Micro-lote: detenido por el usuario")
+        finally:
+            self.conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Modo continuo (micro-lotes) hacia Fact.Opinion")
+    ap.add_argument("--once", action="store_true", help="procesa un solo ciclo y termina")
+    ap.add_argument("--from-start", action="store_true",
+                    help="sin estado previo, procesa todo lo existente en vez de solo lo nuevo")
+    ap.add_argument("--interval", type=float, default=None, help="segundos entre ciclos")
+    args = ap.parse_args()
+
+    opts = dict(cfg.get("microbatch", {}))
+    if args.interval is not None:
+        opts["interval_s"] = args.interval
+    MicroBatchDaemon(opts, from_start=args.from_start).run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
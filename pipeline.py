@@ -1,13 +1,17 @@
 # pipeline.py
 import os
 import sys
+import time
+import argparse
 import subprocess
 
+from core.profiler import new_run_id
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-def run_step(script_name: str) -> None:
+def run_step(script_name: str, extra_args=None) -> None:
     script_path = os.path.join(BASE_DIR, script_name)
 
     if not os.path.exists(script_path):
@@ -16,9 +20,10 @@ def run_step(script_name: str) -> None:
 
     print(f"[PIPELINE] Ejecutando {script_name} ...")
 
-    # Llama: python script_name
+    # Llama: python script_name [--profile --run-id ...]
+    t0 = time.perf_counter()
     result = subprocess.run(
-        [sys.executable, script_path],
+        [sys.executable, script_path] + list(extra_args or []),
         cwd=BASE_DIR
     )
 
@@ -26,22 +31,34 @@ def run_step(script_name: str) -> None:
         print(f"[PIPELINE] ERROR: {script_name} terminó con código {result.returncode}")
         sys.exit(result.returncode)
 
-    print(f"[PIPELINE] {script_name} finalizado correctamente.\n")
+    print(f"[PIPELINE] {script_name} finalizado correctamente "
+          f"({time.perf_counter() - t0:.1f}s).\n")
 
 
-def main():
+def main(profile: bool = False):
     print("======================================")
     print("   PIPELINE DW Opiniones (SQLite → DW)")
     print("======================================\n")
 
+    # Con --profile ambos pasos escriben en el mismo output/profiles/<run_id>/
+    extra = []
+    if profile:
+        run_id = new_run_id()
+        extra = ["--profile", "--run-id", run_id]
+        print(f"[PIPELINE] Profiling activado, run_id={run_id}\n")
+
     # 1) Sincronizar dimensiones en el DW
-    run_step("sync_dimensions_dw.py")
+    run_step("sync_dimensions_dw.py", extra)
 
     # 2) Ejecutar el ETL principal (staging, dims locales, facts, carga al DW)
-    run_step("main.py")
+    run_step("main.py", extra)
 
     print("\n[PIPELINE] Todo el pipeline terminó OK ✅")
 
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Pipeline DW Opiniones")
+    ap.add_argument("--profile", action="store_true",
+                    help="perfila cada etapa de cada paso en output/profiles/<run_id>/")
+    args = ap.parse_args()
+    main(profile=args.profile)
@@ -1,24 +1,34 @@
 # sync_dimensions_dw.py
 import os
 import json
+import argparse
 import sqlite3
 import pandas as pd
-from sqlalchemy import create_engine
 from core.logger import get_logger
-from core.db_engine import get_engine  # o el que uses para SQL Server
+from core.db_engine import get_engine
+from core.profiler import StageProfiler
+from core.dw_repository import append_dimension
+from core.load_journal import run_batched_load
+from core.schema_registry import get_schema, apply_renames, date_format
+from transform.clean_data import parse_date
 
 BASE = os.path.dirname(__file__)
 with open(os.path.join(BASE, "config", "settings.json"), "r", encoding="utf-8") as f:
     cfg = json.load(f)
 
-log = get_logger("sync_dims", cfg["log_path"])
+log = get_logger("sync_dims", cfg["log_path"], **cfg.get("logging", {}))
+
+def main(profile=False, run_id=None):
+    prof = StageProfiler(
+        cfg.get("profiles_dir", "../etl_opiniones/output/profiles"),
+        run_id=run_id, enabled=profile, prefix="sync_", logger=log,
+    )
 
-def main():
     # Conexión a la BD de staging (SQLite)
     conn_stg = sqlite3.connect(cfg["staging_db"])
 
-    # Conexión al DW (SQL Server)
-    engine_dw = get_engine()
+    # Cada dimensión se carga al DW en lotes con checkpoint (core/load_journal.py)
+    batch_size = cfg.get("dw_load", {}).get("batch_size", 5000)
 
     try:
         # ------------------------
@@ -26,123 +36,135 @@ def main():
         # stg_clients: idcliente, nombre, email
         # Dimension.Cliente: IdCliente (IDENTITY o PK), Nombre, Email, Edad, Pais
         # ------------------------
-        try:
-            df_cli = pd.read_sql("SELECT idcliente, nombre, email FROM stg_clients", conn_stg)
-
-            # Ordenamos para que, si IdCliente es IDENTITY, se genere en el mismo orden 1..500
-            df_cli = df_cli.sort_values("idcliente")
-
-            dim_cli = pd.DataFrame({
-                "Nombre": df_cli["nombre"],
-                "Email": df_cli["email"],
-                # Puedes rellenar estos más adelante si quieres
-                "Edad": None,
-                "Pais": None,
-            })
-
-            dim_cli.to_sql(
-                "Cliente",
-                engine_dw,
-                schema="Dimension",
-                if_exists="append",
-                index=False,
-            )
-            log.info(f"Dimension.Cliente poblada: {len(dim_cli)} filas")
-        except Exception as e:
-            log.warning(f"Error poblando Dimension.Cliente: {e}")
+        with prof.stage("Dimension.Cliente") as st:
+            try:
+                df_cli = pd.read_sql("SELECT idcliente, nombre, email FROM stg_clients", conn_stg)
+
+                # Ordenamos para que, si IdCliente es IDENTITY, se genere en el mismo orden 1..500
+                df_cli = df_cli.sort_values("idcliente")
+
+                dim_cli = pd.DataFrame({
+                    "Nombre": df_cli["nombre"],
+                    "Email": df_cli["email"],
+                    # Puedes rellenar estos más adelante si quieres
+                    "Edad": None,
+                    "Pais": None,
+                })
+
+                res = run_batched_load(
+                    conn_stg, "Dimension.Cliente", dim_cli,
+                    lambda conn, part: append_dimension(conn, part, "Cliente"),
+                    batch_size=batch_size, log=log,
+                )
+                st["rows"] = res["filas_loaded"]
+                log.info(f"Dimension.Cliente poblada: {res['filas_loaded']} filas nuevas de {len(dim_cli)}", extra={"stage": "sync_dims", "source": "Dimension.Cliente", "rows": res["filas_loaded"]})
+            except Exception as e:
+                log.warning(f"Error poblando Dimension.Cliente: {e}")
 
         # ------------------------
         # DIMENSION.PRODUCTO
         # stg_products: idproducto, nombre, categoría/categoria
         # Dimension.Producto: IdProducto, Nombre, Categoria, Marca
         # ------------------------
-        try:
-            df_prod = pd.read_sql("SELECT * FROM stg_products", conn_stg)
-
-            # Normalizar nombre de columna categoría -> categoria
-            if "categoría" in df_prod.columns and "categoria" not in df_prod.columns:
-                df_prod = df_prod.rename(columns={"categoría": "categoria"})
-
-            df_prod = df_prod.sort_values("idproducto")
-
-            dim_prod = pd.DataFrame({
-                "Nombre": df_prod["nombre"],
-                "Categoria": df_prod.get("categoria"),
-                "Marca": None,  # Por ahora no hay marca en el CSV
-            })
-
-            dim_prod.to_sql(
-                "Producto",
-                engine_dw,
-                schema="Dimension",
-                if_exists="append",
-                index=False,
-            )
-            log.info(f"Dimension.Producto poblada: {len(dim_prod)} filas")
-        except Exception as e:
-            log.warning(f"Error poblando Dimension.Producto: {e}")
+        with prof.stage("Dimension.Producto") as st:
+            try:
+                df_prod = pd.read_sql("SELECT * FROM stg_products", conn_stg)
+
+                # Normalizar nombre de columna categoría -> categoria
+                df_prod = apply_renames(df_prod, get_schema(cfg, "products_csv"))
+
+                df_prod = df_prod.sort_values("idproducto")
+
+                dim_prod = pd.DataFrame({
+                    "Nombre": df_prod["nombre"],
+                    "Categoria": df_prod.get("categoria"),
+                    "Marca": None,  # Por ahora no hay marca en el CSV
+                })
+
+                res = run_batched_load(
+                    conn_stg, "Dimension.Producto", dim_prod,
+                    lambda conn, part: append_dimension(conn, part, "Producto"),
+                    batch_size=batch_size, log=log,
+                )
+                st["rows"] = res["filas_loaded"]
+                log.info(f"Dimension.Producto poblada: {res['filas_loaded']} filas nuevas de {len(dim_prod)}", extra={"stage": "sync_dims", "source": "Dimension.Producto", "rows": res["filas_loaded"]})
+            except Exception as e:
+                log.warning(f"Error poblando Dimension.Producto: {e}")
 
           # ============================
         # Dimension.Fuente
         # stg_fuente: idfuente, tipofuente, fechacarga
         # Dimension.Fuente: IdFuente (IDENTITY), Nombre, Tipo, FechaCarga
         # ============================
-        try:
-            df_fte = pd.read_sql(
-                "SELECT idfuente, tipofuente, fechacarga FROM stg_fuente",
-                conn_stg
-            )
-            df_fte = df_fte.sort_values("idfuente")
-
-            dim_fte = pd.DataFrame({
-                "Nombre": df_fte["tipofuente"],
-                "Tipo":   df_fte["tipofuente"],  # 👈 esta columna EXISTE en SQL Server y es NOT NULL
-                "FechaCarga": pd.to_datetime(df_fte["fechacarga"], errors="coerce"),
-            })
-
-            dim_fte.to_sql(
-                "Fuente",
-                engine_dw,
-                schema="Dimension",
-                if_exists="append",
-                index=False,
-            )
-            log.info(f"Dimension.Fuente poblada: {len(dim_fte)} filas")
-        except Exception as e:
-            log.warning(f"Error poblando Dimension.Fuente: {e}")
+        with prof.stage("Dimension.Fuente") as st:
+            try:
+                df_fte = pd.read_sql(
+                    "SELECT idfuente, tipofuente, fechacarga FROM stg_fuente",
+                    conn_stg
+                )
+                df_fte = df_fte.sort_values("idfuente")
+
+                dim_fte = pd.DataFrame({
+                    "Nombre": df_fte["tipofuente"],
+                    "Tipo":   df_fte["tipofuente"],  # 👈 esta columna EXISTE en SQL Server y es NOT NULL
+                    "FechaCarga": parse_date(
+                        df_fte["fechacarga"], date_format(get_schema(cfg, "fuente_csv"), "fechacarga")
+                    ),
+                })
+
+                res = run_batched_load(
+                    conn_stg, "Dimension.Fuente", dim_fte,
+                    lambda conn, part: append_dimension(conn, part, "Fuente"),
+                    batch_size=batch_size, log=log,
+                )
+                st["rows"] = res["filas_loaded"]
+                log.info(f"Dimension.Fuente poblada: {res['filas_loaded']} filas nuevas de {len(dim_fte)}", extra={"stage": "sync_dims", "source": "Dimension.Fuente", "rows": res["filas_loaded"]})
+            except Exception as e:
+                log.warning(f"Error poblando Dimension.Fuente: {e}")
 
          # ============================
         # Dimension.Fecha
         # dim_fecha (SQLite): fecha_key, fecha, anio, mes, dia
         # Dimension.Fecha: IdFecha (IDENTITY), Fecha, Anio, Mes, Dia
         # ============================
-        try:
-            df_fecha = pd.read_sql("SELECT * FROM dim_fecha", conn_stg)
-
-            # Evitar fechas duplicadas
-            df_fecha = df_fecha.drop_duplicates(subset=["fecha"])
-
-            dim_fecha = pd.DataFrame({
-                # ❌ NO mandamos IdFecha porque es IDENTITY en SQL Server
-                "Fecha": pd.to_datetime(df_fecha["fecha"], errors="coerce").dt.date,
-                "Anio": df_fecha["anio"],
-                "Mes": df_fecha["mes"],
-                "Dia": df_fecha["dia"],
-            })
-
-            dim_fecha.to_sql(
-                "Fecha",
-                engine_dw,
-                schema="Dimension",
-                if_exists="append",
-                index=False,
-            )
-            log.info(f"Dimension.Fecha poblada: {len(dim_fecha)} filas")
-        except Exception as e:
-            log.warning(f"Error poblando Dimension.Fecha: {e}")
+        with prof.stage("Dimension.Fecha") as st:
+            try:
+                df_fecha = pd.read_sql("SELECT * FROM dim_fecha", conn_stg)
+
+                # Evitar fechas duplicadas
+                df_fecha = df_fecha.drop_duplicates(subset=["fecha"])
+
+                dim_fecha = pd.DataFrame({
+                    # ❌ NO mandamos IdFecha porque es IDENTITY en SQL Server
+                    "Fecha": pd.to_datetime(df_fecha["fecha"], errors="coerce").dt.date,
+                    "Anio": df_fecha["anio"],
+                    "Mes": df_fecha["mes"],
+                    "Dia": df_fecha["dia"],
+                })
+
+                # Fechas que ya están en el DW (p. ej. agregadas por main.add_fechas_dw
+                # o por el modo micro-lote) no se vuelven a insertar
+                en_dw = pd.read_sql("SELECT Fecha FROM Dimension.Fecha", get_engine())
+                dim_fecha = dim_fecha[~dim_fecha["Fecha"].isin(set(pd.to_datetime(en_dw["Fecha"]).dt.date))]
+
+                res = run_batched_load(
+                    conn_stg, "Dimension.Fecha", dim_fecha,
+                    lambda conn, part: append_dimension(conn, part, "Fecha"),
+                    batch_size=batch_size, log=log,
+                )
+                st["rows"] = res["filas_loaded"]
+                log.info(f"Dimension.Fecha poblada: {res['filas_loaded']} filas nuevas de {len(dim_fecha)}", extra={"stage": "sync_dims", "source": "Dimension.Fecha", "rows": res["filas_loaded"]})
+            except Exception as e:
+                log.warning(f"Error poblando Dimension.Fecha: {e}")
 
     finally:
         conn_stg.close()
+        prof.write_summary()
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Sincroniza las dimensiones del DW desde staging")
+    ap.add_argument("--profile", action="store_true",
+                    help="perfila cada dimensión (cProfile + tracemalloc) en output/profiles/<run_id>/")
+    ap.add_argument("--run-id", default=None, help="id de corrida para agrupar perfiles")
+    args = ap.parse_args()
+    main(profile=args.profile, run_id=args.run_id)
@@ -1,44 +1,17 @@
 # test_dw_query.py
-from sqlalchemy import select
-from core.db_engine import engine
-from core.dw_models import (
-    fact_opinion,
-    dim_cliente,
-    dim_producto,
-    dim_fuente,
-    dim_fecha,
-)
-import pandas as pd
+from contextlib import closing
+from core.dw_queries import iter_opiniones_detalle, resumen_producto_mes
 
 def ejemplo_consulta():
-    stmt = (
-        select(
-            fact_opinion.c.IdOpinion,
-            dim_cliente.c.Nombre.label("Cliente"),
-            dim_producto.c.Nombre.label("Producto"),
-            dim_fuente.c.Tipo.label("TipoFuente"),
-            dim_fecha.c.Fecha,
-            fact_opinion.c.Calificacion,
-            fact_opinion.c.Sentimiento,
-            fact_opinion.c.Satisfaccion,
-            fact_opinion.c.Comentario,
-        )
-        .select_from(
-            fact_opinion
-            .join(dim_cliente, fact_opinion.c.IdCliente == dim_cliente.c.IdCliente)
-            .join(dim_producto, fact_opinion.c.IdProducto == dim_producto.c.IdProducto)
-            .join(dim_fuente,  fact_opinion.c.IdFuente  == dim_fuente.c.IdFuente)
-            .join(dim_fecha,   fact_opinion.c.IdFecha   == dim_fecha.c.IdFecha)
-        )
-    )
+    # Detalle en bloques (yield_per) en lugar de fetchall(); closing cierra
+    # el generador (y con él cursor y conexión) al cortar el recorrido
+    with closing(iter_opiniones_detalle(chunk_size=5000)) as bloques:
+        for df in bloques:
+            print(df.head())
+            break
 
-    with engine.connect() as conn:
-        result = conn.execute(stmt)
-        rows = result.fetchall()
-        cols = result.keys()
-
-    df = pd.DataFrame(rows, columns=cols)
-    print(df.head())
+    # Agregado materializado por producto/fuente/mes
+    print(resumen_producto_mes().head())
 
 if __name__ == "__main__":
     ejemplo_consulta()
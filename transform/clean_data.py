@@ -6,8 +6,8 @@ def normalize_text(s: pd.Series) -> pd.Series:
               .str.strip()
               .str.replace(r"\s+", " ", regex=True))
 
-def parse_date(series: pd.Series) -> pd.Series:
-    return pd.to_datetime(series, errors="coerce", utc=False).dt.tz_localize(None)
+def parse_date(series: pd.Series, fmt: str = None) -> pd.Series:
+    return pd.to_datetime(series, format=fmt, errors="coerce", utc=False).dt.tz_localize(None)
 
 def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -26,4 +26,16 @@ def build_dim_fecha(dates: pd.Series) -> pd.DataFrame:
     dim["trimestre"] = dim["fecha"].dt.quarter
     dim["mes_nombre"] = dim["fecha"].dt.month_name()
     dim["dia_semana"] = dim["fecha"].dt.day_name()
-    return dim[["fecha_key","fecha","anio","mes","dia","trimestre","mes_nombre","dia_semana"]]
\ No newline at end of file
+    return dim[["fecha_key","fecha","anio","mes","dia","trimestre","mes_nombre","dia_semana"]]
+
+def periodos_between(desde, hasta) -> list:
+    """Periodos YYYYMM (int) que tocan el rango de fechas [desde, hasta]."""
+    meses = pd.period_range(pd.Timestamp(desde), pd.Timestamp(hasta), freq="M")
+    return [p.year * 100 + p.month for p in meses]
+
+def periodo_bounds(periodos) -> tuple:
+    """('YYYY-MM-01' del primer periodo, 'YYYY-MM-01' del mes siguiente al último)."""
+    ini, fin = min(periodos), max(periodos)
+    start = pd.Timestamp(year=ini // 100, month=ini % 100, day=1)
+    end = pd.Timestamp(year=fin // 100, month=fin % 100, day=1) + pd.offsets.MonthBegin(1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")